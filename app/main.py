@@ -4,15 +4,16 @@ FinRiskGPT Backend API
 AI-Powered Financial Risk Analysis Assistant
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, BackgroundTasks, Query
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional, Union
+from contextlib import asynccontextmanager
 import asyncio
+import hashlib
 import json
 import os
-import tempfile
 import uuid
 from datetime import datetime
 import logging
@@ -25,20 +26,66 @@ from services import InRiskGPTServices
 from utils.auth import get_current_user, User
 from utils.database import DatabaseManager
 from utils.config import Config
+from utils.uploads import check_content_length, stream_upload_to_disk, ContentLengthRequiredError, UploadTooLargeError
+from utils.job_queue import create_job_backend
+from services.job_worker import JobContext, JobWorkerPool
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared resources on startup and release them on shutdown"""
+    global job_workers
+    await db_manager.connect()
+    await job_backend.initialize()
+    # In-process job workers, unless jobs are handled by app/worker.py
+    if Config.JOB_WORKERS_IN_API:
+        job_workers = build_job_worker_pool()
+        await job_workers.start()
+    try:
+        yield
+    finally:
+        if job_workers is not None:
+            await job_workers.stop()
+        await close_shared_resources()
+
+async def close_shared_resources():
+    """Release everything opened by the services and the job/DB backends (API and standalone worker)"""
+    await job_backend.close()
+    services.pdf_processor.shutdown()
+    await services.rag_service.aclose()
+    if services.risk_analyzer.result_cache is not None:
+        await services.risk_analyzer.result_cache.close()
+    await services.llm_registry.aclose()
+    await db_manager.close()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="FinRiskGPT API",
     description="AI-Powered Financial Risk Analysis Assistant",
     version="2.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
+UPLOAD_PATH = "/api/documents/upload"
+
+# Registered before CORS so that its 411/413 responses still get CORS headers
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """Reject oversized uploads from their Content-Length, before the body is spooled"""
+    if request.method == "POST" and request.url.path == UPLOAD_PATH:
+        try:
+            check_content_length(request.headers.get("content-length"))
+        except ContentLengthRequiredError as e:
+            return JSONResponse(status_code=411, content={"detail": str(e)})
+        except UploadTooLargeError as e:
+            return JSONResponse(status_code=413, content={"detail": str(e)})
+    return await call_next(request)
+
 # CORS middleware for frontend integration
 app.add_middleware(
     CORSMiddleware,
@@ -51,9 +98,13 @@ app.add_middleware(
 # Initialize services
 services = InRiskGPTServices()
 db_manager = DatabaseManager()
+# Deduplicated uploads read paragraphs and vectorstores of their canonical document
+services.pdf_processor.document_resolver = db_manager.resolve_storage_document_id
 
-# Global state for background tasks
-background_tasks_status = {}
+# Durable job queue shared by all API processes (and standalone workers)
+RISK_ANALYSIS_JOB = "risk_analysis"
+job_backend = create_job_backend(Config.JOB_BACKEND_URL)
+job_workers: Optional[JobWorkerPool] = None
 
 class HealthResponse(BaseModel):
     status: str
@@ -68,10 +119,26 @@ class DocumentUploadResponse(BaseModel):
 
 class TaskStatusResponse(BaseModel):
     task_id: str
-    status: str  # "pending", "processing", "completed", "failed"
+    status: str  # "pending", "processing", "completed", "failed", "cancelled"
     progress: float
     result: Optional[Dict[Any, Any]] = None
     error_message: Optional[str] = None
+    partial_results: List[Dict[Any, Any]] = []  # results completed since the requested cursor
+    next_cursor: int = 0
+    completed_items: int = 0
+    total_items: int = 0
+
+def build_job_worker_pool() -> JobWorkerPool:
+    """Worker pool running the job handlers defined in this module"""
+    return JobWorkerPool(
+        job_backend,
+        {RISK_ANALYSIS_JOB: run_risk_analysis_job},
+        concurrency=Config.JOB_WORKERS,
+        poll_interval=Config.JOB_POLL_INTERVAL,
+        lease_seconds=Config.JOB_LEASE_SECONDS,
+        heartbeat_interval=Config.JOB_HEARTBEAT_SECONDS,
+        ttl_seconds=Config.JOB_TTL_HOURS * 3600
+    )
 
 # ==================== HEALTH CHECK ====================
 @app.get("/health", response_model=HealthResponse)
@@ -84,7 +151,7 @@ async def health_check():
     )
 
 # ==================== DOCUMENT PROCESSING ====================
-@app.post("/api/documents/upload", response_model=DocumentUploadResponse)
+@app.post(UPLOAD_PATH, response_model=DocumentUploadResponse)
 async def upload_document(
     file: UploadFile = File(...),
     document_type: str = Query("10-K", description="Type of document"),
@@ -101,26 +168,37 @@ async def upload_document(
         # Generate unique document ID
         document_id = str(uuid.uuid4())
         
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as tmp_file:
-            content = await file.read()
-            tmp_file.write(content)
-            tmp_file_path = tmp_file.name
-        
-        # Process PDF
-        extracted_data = await services.process_document(
-            tmp_file_path,
-            document_id=document_id,
-            metadata={
-                "document_type": document_type,
-                "company": company,
-                "filing_date": filing_date,
-                "user_id": current_user.id
-            }
-        )
+        # Stream uploaded file to disk in bounded-size chunks (size limit + hash in one pass)
+        upload = await stream_upload_to_disk(file, suffix='.pdf')
+        tmp_file_path = upload["path"]
         
-        # Clean up temporary file
-        os.unlink(tmp_file_path)
+        # Reuse artefacts of an identical, already-processed upload if there is one
+        processing_status = "completed"
+        canonical_document_id = None
+        try:
+            existing = await db_manager.find_document_by_hash(upload["sha256"])
+            if existing and services.pdf_processor.has_processed_document(existing["document_id"]):
+                canonical_document_id = existing["document_id"]
+                paragraphs_count = existing["paragraphs_count"]
+                processing_status = "deduplicated"
+            else:
+                # No canonical document, or its paragraph store is gone: process and take the hash over
+                extracted_data = await services.process_document(
+                    tmp_file_path,
+                    document_id=document_id,
+                    metadata={
+                        "document_type": document_type,
+                        "company": company,
+                        "filing_date": filing_date,
+                        "user_id": current_user.id,
+                        "content_hash": upload["sha256"],
+                        "file_size": upload["size"]
+                    }
+                )
+                paragraphs_count = extracted_data['paragraphs_count']
+        finally:
+            # Clean up temporary file
+            os.unlink(tmp_file_path)
         
         # Store document metadata in database
         await db_manager.store_document_metadata(
@@ -130,16 +208,22 @@ async def upload_document(
             document_type=document_type,
             company=company,
             filing_date=filing_date,
-            paragraphs_count=len(extracted_data['paragraphs'])
+            paragraphs_count=paragraphs_count,
+            content_hash=upload["sha256"],
+            canonical_document_id=canonical_document_id
         )
         
         return DocumentUploadResponse(
             document_id=document_id,
             filename=file.filename,
-            paragraphs_extracted=len(extracted_data['paragraphs']),
-            processing_status="completed"
+            paragraphs_extracted=paragraphs_count,
+            processing_status=processing_status
         )
         
+    except HTTPException:
+        raise
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         logger.error(f"Document upload failed: {repr(e)}")
         raise HTTPException(status_code=500, detail=f"Document processing failed: {repr(e)}")
@@ -147,95 +231,145 @@ async def upload_document(
 @app.get("/api/documents/{document_id}/paragraphs")
 async def get_document_paragraphs(
     document_id: str,
+    offset: int = Query(0, ge=0, description="Index of the first paragraph to return"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Maximum number of paragraphs to return"),
+    section: Optional[str] = Query(None, description="Filter by section name (case-insensitive substring)"),
+    page_start: Optional[int] = Query(None, ge=0, description="First page to include"),
+    page_end: Optional[int] = Query(None, ge=0, description="Last page to include"),
     current_user: User = Depends(get_current_user)
 ):
     """Get extracted paragraphs from a document"""
     try:
-        paragraphs = await services.pdf_processor.get_document_paragraphs(document_id, current_user.id)
-        return {"document_id": document_id, "paragraphs": paragraphs}
-    except Exception as e:
+        result = await services.pdf_processor.query_document_paragraphs(
+            document_id,
+            current_user.id,
+            offset=offset,
+            limit=limit,
+            section=section,
+            page_start=page_start,
+            page_end=page_end
+        )
+        return result
+    except FileNotFoundError as e:
         raise HTTPException(status_code=404, detail=f"Document not found: {repr(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Paragraph lookup failed: {repr(e)}")
+
+@app.get("/api/documents/cache/stats")
+async def get_paragraph_cache_stats(current_user: User = Depends(get_current_user)):
+    """Get paragraph cache hit/miss counters"""
+    return services.pdf_processor.paragraph_cache_stats()
 
 # ==================== RISK ANALYSIS ====================
+def risk_analysis_resume_key(request: RiskAnalysisRequest) -> str:
+    """Analyses of the same document, prompt versions and paragraph limit can share partial results"""
+    prompt_versions = []
+    for prompt_id in sorted(set(request.selected_prompts)):
+        try:
+            version = services.llm_registry.get_prompt_config(prompt_id).version
+        except ValueError:
+            version = None
+        prompt_versions.append(f"{prompt_id}@{version}")
+    raw_key = json.dumps([request.document_id, prompt_versions, request.max_paragraphs])
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
 @app.post("/api/analysis/risk", response_model=Dict[str, str])
 async def start_risk_analysis(
     request: RiskAnalysisRequest,
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user)
 ):
-    """Start risk analysis for a document"""
-    task_id = str(uuid.uuid4())
-    
-    # Initialize task status
-    background_tasks_status[task_id] = {
-        "status": "pending",
-        "progress": 0.0,
-        "result": None,
-        "error_message": None
-    }
-    
-    # Start background analysis
-    background_tasks.add_task(
-        run_risk_analysis_task,
-        task_id,
-        request,
-        current_user.id
+    """Queue risk analysis for a document (re-submitting an unfinished analysis resumes it)"""
+    if await db_manager.resolve_storage_document_id(request.document_id, current_user.id) is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    task_id = await job_backend.enqueue(
+        RISK_ANALYSIS_JOB,
+        request.dict(),
+        user_id=current_user.id,
+        priority=request.priority,
+        resume_key=risk_analysis_resume_key(request)
     )
-    
     return {"task_id": task_id, "status": "started"}
 
-async def run_risk_analysis_task(task_id: str, request: RiskAnalysisRequest, user_id: str):
-    """Background task for risk analysis"""
-    try:
-        background_tasks_status[task_id]["status"] = "processing"
-        
-        # Get document paragraphs
-        paragraphs = await services.pdf_processor.get_document_paragraphs(request.document_id, user_id)
-        
-        # Run analysis with selected prompts
-        results = await services.analyze_risks(
-            paragraphs=paragraphs,
-            prompts=request.selected_prompts,
-            model_name=None
-        )
-        
-        # Store results
-        await db_manager.store_analysis_results(
-            document_id=request.document_id,
-            user_id=user_id,
-            results=results,
-            prompts_used=request.selected_prompts
+async def run_risk_analysis_job(job: Dict[str, Any], ctx: JobContext) -> Dict[str, Any]:
+    """Job handler for risk analysis; resumes from partial results of earlier attempts or runs"""
+    request = RiskAnalysisRequest(**job["payload"])
+    user_id = job["user_id"]
+    
+    # Get document paragraphs
+    paragraphs = await services.pdf_processor.get_document_paragraphs(request.document_id, user_id)
+    
+    previous_results = await ctx.previous_results()
+    done_pairs = {(result["prompt"], result.get("paragraph_index")) for result in previous_results}
+    if done_pairs:
+        logger.info(f"Resuming risk analysis {ctx.job_id} with {len(done_pairs)} analyses already done")
+    
+    async def on_progress(new_results: List[Dict], progress: Dict):
+        # Keep below 100 until results are stored
+        await ctx.report(
+            results=new_results,
+            progress=round(99.0 * progress["completed"] / progress["total"], 1) if progress["total"] else None,
+            completed_items=progress["completed"],
+            total_items=progress["total"],
+            checkpoint={"completed": progress["completed"], "failed": progress["failed"]}
         )
-        
-        background_tasks_status[task_id]["status"] = "completed"
-        background_tasks_status[task_id]["progress"] = 100.0
-        background_tasks_status[task_id]["result"] = results
-        
-    except Exception as e:
-        logger.error(f"Risk analysis task {task_id} failed: {repr(e)}")
-        background_tasks_status[task_id]["status"] = "failed"
-        background_tasks_status[task_id]["error_message"] = repr(e)
-
-def update_task_progress(task_id: str, progress: float):
-    """Update task progress"""
-    if task_id in background_tasks_status:
-        background_tasks_status[task_id]["progress"] = progress
+    
+    # Run analysis with selected prompts
+    results = await services.analyze_risks(
+        paragraphs=paragraphs,
+        prompts=request.selected_prompts,
+        model_name=None,
+        max_paragraphs=request.max_paragraphs,
+        progress_callback=on_progress,
+        skip_pairs=done_pairs
+    )
+    results["results"] = previous_results + results["results"]
+    
+    # Store results
+    await db_manager.store_analysis_results(
+        document_id=request.document_id,
+        user_id=user_id,
+        results=results,
+        prompts_used=request.selected_prompts
+    )
+    return results
 
 @app.get("/api/analysis/status/{task_id}", response_model=TaskStatusResponse)
-async def get_analysis_status(task_id: str):
-    """Get status of analysis task"""
-    if task_id not in background_tasks_status:
+async def get_analysis_status(
+    task_id: str,
+    cursor: int = Query(0, ge=0, description="Number of partial results already received"),
+    current_user: User = Depends(get_current_user)
+):
+    """Get status of analysis task, with results completed since `cursor`"""
+    job = await job_backend.get(task_id)
+    if job is None or job["user_id"] != current_user.id:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    status_data = background_tasks_status[task_id]
+    partial_results = await job_backend.get_results(task_id, cursor)
     return TaskStatusResponse(
         task_id=task_id,
-        status=status_data["status"],
-        progress=status_data["progress"],
-        result=status_data["result"],
-        error_message=status_data.get("error_message")
+        status=job["status"],
+        progress=job["progress"],
+        result=job["result"],
+        error_message=job["error_message"],
+        partial_results=partial_results,
+        next_cursor=cursor + len(partial_results),
+        completed_items=job["completed_items"],
+        total_items=job["total_items"]
     )
 
+@app.post("/api/analysis/cancel/{task_id}")
+async def cancel_analysis(
+    task_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Cancel a pending or running analysis task"""
+    job = await job_backend.get(task_id)
+    if job is None or job["user_id"] != current_user.id:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if not await job_backend.request_cancel(task_id):
+        raise HTTPException(status_code=409, detail=f"Task already {job['status']}")
+    return {"task_id": task_id, "status": "cancelling"}
+
 # ==================== PROMPT MANAGEMENT ====================
 @app.get("/api/prompts/templates")
 async def get_prompt_templates():
@@ -252,13 +386,11 @@ async def save_custom_prompt(
 ):
     """Save custom prompt template"""
     try:
-        # Note: db_manager.store_custom_prompt is not implemented yet
-        # Placeholder implementation
-        await db_manager.store_analysis_results(
-            document_id="custom_prompt_" + prompt_data.id,
+        await db_manager.store_custom_prompt(
+            prompt_id=prompt_data.id,
             user_id=current_user.id,
-            results={"prompt": prompt_data.dict()},
-            prompts_used=["custom"]
+            template=prompt_data.dict(),
+            wait=False  # acknowledged asynchronously by the write-behind queue
         )
         return {"status": "success", "prompt_id": prompt_data.id}
     except Exception as e:
@@ -302,11 +434,13 @@ async def generate_risk_graph(
 ):
     """Generate risk knowledge graph"""
     try:
-        # Get analysis results
-        analysis_data = await db_manager.get_analysis_results(
+        # Only the columns the graph needs
+        findings = await db_manager.get_findings(
             request.document_id,
-            current_user.id
+            current_user.id,
+            columns=["risk_type", "specific_risk", "severity"]
         )
+        analysis_data = {"findings": findings} if findings else None
         
         # Generate graph
         graph_data = await services.generate_risk_graph(
@@ -340,6 +474,8 @@ async def multi_model_analysis(
         )
         
         return results
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=f"Document not found: {repr(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Multi-model analysis failed: {repr(e)}")
 
@@ -412,6 +548,8 @@ async def get_risk_trends(
     try:
         trends_data = await db_manager.get_risk_trends(current_user.id, timeframe)
         return trends_data
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Trends data fetch failed: {repr(e)}")
 
@@ -433,6 +571,8 @@ async def compliance_audit(
         )
         
         return audit_results
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=f"Document not found: {repr(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Compliance audit failed: {repr(e)}")
 
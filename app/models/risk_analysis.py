@@ -11,6 +11,7 @@ class RiskAnalysisRequest(BaseModel):
     selected_prompts: List[str]
     custom_prompts: Optional[Dict[str, str]] = None
     max_paragraphs: Optional[int] = 200
+    priority: int = 0  # higher runs first
 
 class RiskAnalysisResponse(BaseModel):
     analysis_id: str
@@ -3,19 +3,24 @@ from pyvis.network import Network
 import logging
 from pathlib import Path
 
+from ..utils.findings import extract_finding
+
 class GraphService:
     def __init__(self):
         pass  # 移除共享图实例
 
     async def generate_risk_graph(self, analysis_data: dict, company_name: str) -> dict:
-        """Generate a risk graph from analysis data."""
+        """Generate a risk graph from analysis data ("findings" rows, or full "results")."""
         try:
             graph = nx.DiGraph()  # 每次创建新图
             graph.add_node(company_name, label=company_name, color="blue", size=30)
-            for result in analysis_data.get("results", []):
-                risk_type = result["analysis"].get("risk_type_1", "Unknown")
-                specific_risk = result["analysis"].get("specific_risk", "Unknown")
-                severity = result["analysis"].get("severity_1", "Medium")
+            findings = analysis_data.get("findings")
+            if findings is None:
+                findings = [extract_finding(result) for result in analysis_data.get("results", [])]
+            for finding in findings:
+                risk_type = finding.get("risk_type") or "Unknown"
+                specific_risk = finding.get("specific_risk") or "Unknown"
+                severity = finding.get("severity") or "Medium"
                 graph.add_node(risk_type, label=risk_type, color="orange", size=20)
                 graph.add_node(specific_risk, label=specific_risk, color="red", size=15)
                 graph.add_edge(company_name, risk_type, title="contains")
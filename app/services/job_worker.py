@@ -0,0 +1,213 @@
+# services/job_worker.py
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from ..utils.job_queue import JobBackend
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler when its job was cancelled or its lease was lost"""
+
+
+class JobContext:
+    """Handle passed to job handlers for reporting progress and partial results.
+
+    Results are buffered and flushed to the backend together with progress and
+    the checkpoint, at most every flush_interval seconds (or once flush_size
+    results are pending), so storage writes stay cheap for fine-grained progress.
+    """
+
+    def __init__(self, backend: JobBackend, job: Dict[str, Any], worker_id: str,
+                 flush_interval: float = 2.0, flush_size: int = 50):
+        self.backend = backend
+        self.job = job
+        self.worker_id = worker_id
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.checkpoint: Dict[str, Any] = dict(job.get("checkpoint") or {})
+        self.cancelled: Optional[str] = None  # "requested" or "lease_lost"
+        self._pending_results: List[Dict[str, Any]] = []
+        self._progress: Dict[str, Any] = {}
+        self._last_flush = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @property
+    def job_id(self) -> str:
+        return self.job["id"]
+
+    @property
+    def payload(self) -> Dict[str, Any]:
+        return self.job["payload"]
+
+    async def previous_results(self) -> List[Dict[str, Any]]:
+        """Partial results stored by earlier attempts of this job (for resuming).
+
+        A job with a resume_key that has no results yet first adopts those of the
+        latest failed or cancelled job with the same key.
+        """
+        if self.job.get("resume_key"):
+            await self.backend.adopt_results(self.job_id)
+        return await self.backend.get_results(self.job_id)
+
+    async def report(self, results: List[Dict[str, Any]] = None, progress: float = None,
+                     completed_items: int = None, total_items: int = None,
+                     checkpoint: Dict[str, Any] = None, force: bool = False):
+        if self.cancelled:
+            raise JobCancelled(self.job_id)
+        if results:
+            self._pending_results.extend(results)
+        if checkpoint:
+            self.checkpoint.update(checkpoint)
+        for key, value in (("progress", progress), ("completed_items", completed_items), ("total_items", total_items)):
+            if value is not None:
+                self._progress[key] = value
+        due = time.monotonic() - self._last_flush >= self.flush_interval
+        if force or due or len(self._pending_results) >= self.flush_size:
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            results, self._pending_results = self._pending_results, []
+            progress, self._progress = self._progress, {}
+            self._last_flush = time.monotonic()
+            await self.backend.save_progress(
+                self.job_id, self.worker_id,
+                checkpoint=self.checkpoint or None,
+                results=results,
+                **progress
+            )
+
+
+JobHandler = Callable[[Dict[str, Any], JobContext], Awaitable[Dict[str, Any]]]
+
+
+class JobWorkerPool:
+    """Pool of asyncio workers that claim jobs from a JobBackend and run registered handlers.
+
+    Each running job holds a lease renewed by a heartbeat; when the heartbeat finds
+    the job cancelled or the lease taken over, the handler is cancelled. Finished
+    jobs older than ttl_seconds are removed periodically.
+    """
+
+    def __init__(
+        self,
+        backend: JobBackend,
+        handlers: Dict[str, JobHandler],
+        concurrency: int = 2,
+        poll_interval: float = 1.0,
+        lease_seconds: float = 60.0,
+        heartbeat_interval: float = 15.0,
+        ttl_seconds: float = 24 * 3600,
+        cleanup_interval: float = 600.0
+    ):
+        self.backend = backend
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = heartbeat_interval
+        self.ttl_seconds = ttl_seconds
+        self.cleanup_interval = cleanup_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._tasks: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._stopping = False
+
+    async def start(self):
+        await self.backend.initialize()
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._worker_loop(slot)) for slot in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._cleanup_loop()))
+        logger.info(f"Job worker {self.worker_id} started with {self.concurrency} slots")
+
+    async def stop(self):
+        """Stop claiming jobs and hand running jobs back to the queue"""
+        self._stopping = True
+        for task in self._running.values():
+            task.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info(f"Job worker {self.worker_id} stopped")
+
+    async def _worker_loop(self, slot: int):
+        while not self._stopping:
+            try:
+                job = await self.backend.claim(self.worker_id, list(self.handlers), self.lease_seconds)
+            except Exception as e:
+                logger.error(f"Job claim failed: {repr(e)}")
+                job = None
+            if job is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            await self._run_job(job)
+
+    async def _run_job(self, job: Dict[str, Any]):
+        job_id = job["id"]
+        ctx = JobContext(self.backend, job, self.worker_id)
+        handler_task = asyncio.create_task(self.handlers[job["job_type"]](job, ctx))
+        self._running[job_id] = handler_task
+        heartbeat = asyncio.create_task(self._heartbeat(job_id, ctx, handler_task))
+        logger.info(f"Job {job_id} ({job['job_type']}) claimed, attempt {job['attempts']}")
+        try:
+            result = await handler_task
+            await ctx.flush()
+            await self.backend.complete(job_id, self.worker_id, result)
+        except (asyncio.CancelledError, JobCancelled):
+            if ctx.cancelled == "lease_lost":
+                logger.warning(f"Job {job_id} lease lost, abandoning")
+            elif ctx.cancelled:
+                await self._flush_quietly(ctx)
+                await self.backend.mark_cancelled(job_id, self.worker_id)
+                logger.info(f"Job {job_id} cancelled")
+            else:
+                # Shutdown: keep what was done and let another worker resume
+                await self._flush_quietly(ctx)
+                await self.backend.release(job_id, self.worker_id)
+                if self._stopping:
+                    raise
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {repr(e)}")
+            await self._flush_quietly(ctx)
+            await self.backend.fail(job_id, self.worker_id, repr(e))
+        finally:
+            heartbeat.cancel()
+            self._running.pop(job_id, None)
+
+    @staticmethod
+    async def _flush_quietly(ctx: JobContext):
+        try:
+            await ctx.flush()
+        except Exception as e:
+            logger.error(f"Job {ctx.job_id} progress flush failed: {repr(e)}")
+
+    async def _heartbeat(self, job_id: str, ctx: JobContext, handler_task: asyncio.Task):
+        while not handler_task.done():
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                state = await self.backend.heartbeat(job_id, self.worker_id, self.lease_seconds)
+            except Exception as e:
+                logger.error(f"Heartbeat for job {job_id} failed: {repr(e)}")
+                continue
+            if not state["owned"]:
+                ctx.cancelled = "lease_lost"
+                handler_task.cancel()
+            elif state["cancel_requested"]:
+                ctx.cancelled = "requested"
+                handler_task.cancel()
+
+    async def _cleanup_loop(self):
+        while not self._stopping:
+            try:
+                await self.backend.cleanup(self.ttl_seconds)
+            except Exception as e:
+                logger.error(f"Job cleanup failed: {repr(e)}")
+            await asyncio.sleep(self.cleanup_interval)
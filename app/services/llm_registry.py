@@ -0,0 +1,137 @@
+# services/llm_registry.py
+import hashlib
+import logging
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from langchain_openai import ChatOpenAI
+from langchain.prompts import ChatPromptTemplate
+from langchain.schema.output_parser import StrOutputParser
+
+from ..utils.cache import LRUCache
+from ..utils.prompt_registry import PROMPT_REGISTRY, PromptTemplate
+from ..utils.rag_config import RAGConfig
+
+try:
+    import httpx
+    httpx_available = True
+except ImportError:
+    httpx = None
+    httpx_available = False
+
+logger = logging.getLogger(__name__)
+
+
+class LLMRegistry:
+    """Process-wide registry of compiled prompts, chains and chat clients.
+
+    Registry prompts are compiled into ChatPromptTemplates once; ad-hoc templates
+    are memoised by a hash of their text in a bounded LRU. One chat client is kept
+    per (model, temperature, max_tokens), all sharing one keep-alive HTTP
+    connection pool, so per-call work is limited to the request itself.
+    """
+
+    def __init__(self, config: Dict[str, Any] = None):
+        config = config or {}
+        self.api_key = os.getenv("OPENAI_API_KEY", RAGConfig.OPENAI_API_KEY)
+        self.max_connections = config.get("llm_max_connections", RAGConfig.LLM_MAX_CONNECTIONS)
+        self.keepalive_expiry = config.get("llm_keepalive_expiry", RAGConfig.LLM_KEEPALIVE_EXPIRY)
+        self.output_parser = StrOutputParser()
+        self._http_client = None
+        self._clients: Dict[Tuple, ChatOpenAI] = {}
+        self._templates: Dict[str, ChatPromptTemplate] = {}
+        self._adhoc_templates = LRUCache(
+            maxsize=config.get("llm_adhoc_template_cache_size", RAGConfig.LLM_ADHOC_TEMPLATE_CACHE_SIZE)
+        )
+        self._chains: Dict[Tuple, Any] = {}
+
+    # ===== Prompts =====
+
+    def compile_all(self, suffixes: Dict[str, str] = None):
+        """Compile every registry prompt up front (optionally with suffixed variants, e.g. batch mode)"""
+        for prompt_id in PROMPT_REGISTRY:
+            self.get_template(prompt_id)
+            for variant, suffix in (suffixes or {}).items():
+                self.get_template(prompt_id, variant=variant, suffix=suffix)
+        logger.info(f"Compiled {len(self._templates)} prompt templates")
+
+    def get_prompt_config(self, prompt_id: str) -> PromptTemplate:
+        if prompt_id not in PROMPT_REGISTRY:
+            raise ValueError(f"Prompt ID '{prompt_id}' not found in registry")
+        return PROMPT_REGISTRY[prompt_id]
+
+    def get_template(self, prompt_id: str, variant: str = None, suffix: str = "") -> ChatPromptTemplate:
+        """Compiled ChatPromptTemplate for a registry prompt (variant adds a fixed suffix)"""
+        key = f"{prompt_id}:{variant}" if variant else prompt_id
+        template = self._templates.get(key)
+        if template is None:
+            template = ChatPromptTemplate.from_template(self.get_prompt_config(prompt_id).template + suffix)
+            self._templates[key] = template
+        return template
+
+    def compile_template(self, text: str) -> ChatPromptTemplate:
+        """Compile and memoise an ad-hoc (non-registry) template, keyed by a hash of its text"""
+        key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        template = self._adhoc_templates.get(key)
+        if template is None:
+            template = ChatPromptTemplate.from_template(text)
+            self._adhoc_templates.put(key, template)
+        return template
+
+    # ===== Clients =====
+
+    def _shared_http_client(self):
+        if self._http_client is None and httpx_available:
+            self._http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=self.keepalive_expiry
+                ),
+                timeout=httpx.Timeout(60.0, connect=10.0)
+            )
+        return self._http_client
+
+    def get_client(self, model: str = None, temperature: float = None, max_tokens: int = None) -> ChatOpenAI:
+        """Shared client for this model configuration"""
+        key = (model or RAGConfig.LLM_MODEL, temperature, max_tokens)
+        client = self._clients.get(key)
+        if client is None:
+            kwargs = {"model": key[0], "api_key": self.api_key}
+            if temperature is not None:
+                kwargs["temperature"] = temperature
+            if max_tokens is not None:
+                kwargs["max_tokens"] = max_tokens
+            # Older langchain-openai releases have no async client hook; they keep their own pool
+            http_client = self._shared_http_client() if "http_async_client" in ChatOpenAI.__fields__ else None
+            if http_client is not None:
+                kwargs["http_async_client"] = http_client
+            client = self._clients[key] = ChatOpenAI(**kwargs)
+        return client
+
+    # ===== Chains =====
+
+    def get_chain(self, prompt_id: str, model: str = None, variant: str = None, suffix: str = ""):
+        """prompt | client | parser, built once per (prompt, model, variant)"""
+        key = (prompt_id, model or RAGConfig.LLM_MODEL, variant)
+        chain = self._chains.get(key)
+        if chain is None:
+            template = self.get_template(prompt_id, variant=variant, suffix=suffix)
+            chain = self._chains[key] = template | self.get_client(key[1]) | self.output_parser
+        return chain
+
+    async def aclose(self):
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+
+_default_registry: Optional[LLMRegistry] = None
+
+
+def get_llm_registry(config: Dict[str, Any] = None) -> LLMRegistry:
+    """Shared registry for services that are not handed one explicitly"""
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = LLMRegistry(config)
+    return _default_registry
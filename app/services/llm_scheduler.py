@@ -0,0 +1,161 @@
+# services/llm_scheduler.py
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from ..utils.rag_config import RAGConfig
+
+logger = logging.getLogger(__name__)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Detect provider rate-limit errors (HTTP 429) without importing provider SDKs."""
+    if type(error).__name__ == "RateLimitError":
+        return True
+    if getattr(error, "status_code", None) == 429:
+        return True
+    response = getattr(error, "response", None)
+    if getattr(response, "status_code", None) == 429:
+        return True
+    message = str(error).lower()
+    return "rate limit" in message or "429" in message
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after") if hasattr(headers, "get") else None
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class RateBudget:
+    """Per-minute token bucket; waiters are served in FIFO order."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self.refill_rate = per_minute / 60.0
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.refill_rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1.0):
+        # A single request larger than the whole budget waits for a full bucket
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                await asyncio.sleep((amount - self.available) / self.refill_rate)
+
+
+class LLMScheduler:
+    """Bounded-concurrency scheduler for LLM calls.
+
+    Enforces a concurrency cap plus request-per-minute and token-per-minute
+    budgets, retries rate-limit errors with jittered exponential backoff and
+    records retries and drops in a per-task stats dict (see new_stats()).
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = None,
+        requests_per_minute: int = None,
+        tokens_per_minute: int = None,
+        max_retries: int = None,
+        base_delay: float = None,
+        max_delay: float = None
+    ):
+        self.max_concurrency = max_concurrency or RAGConfig.LLM_MAX_CONCURRENCY
+        self.max_retries = max_retries if max_retries is not None else RAGConfig.LLM_MAX_RETRIES
+        self.base_delay = base_delay or RAGConfig.LLM_RETRY_BASE_DELAY
+        self.max_delay = max_delay or RAGConfig.LLM_RETRY_MAX_DELAY
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        rpm = requests_per_minute or RAGConfig.LLM_REQUESTS_PER_MINUTE
+        tpm = tokens_per_minute or RAGConfig.LLM_TOKENS_PER_MINUTE
+        self.request_budget = RateBudget(rpm) if rpm else None
+        self.token_budget = RateBudget(tpm) if tpm else None
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "LLMScheduler":
+        return cls(
+            max_concurrency=config.get("llm_max_concurrency"),
+            requests_per_minute=config.get("llm_requests_per_minute"),
+            tokens_per_minute=config.get("llm_tokens_per_minute"),
+            max_retries=config.get("llm_max_retries"),
+            base_delay=config.get("llm_retry_base_delay"),
+            max_delay=config.get("llm_retry_max_delay")
+        )
+
+    @staticmethod
+    def new_stats() -> Dict[str, Any]:
+        """Fresh accounting dict for one logical task (e.g. one analysis run)."""
+        return {
+            "submitted": 0,
+            "succeeded": 0,
+            "dropped": 0,
+            "retries": 0,
+            "rate_limited": 0,
+            "estimated_tokens": 0
+        }
+
+    @staticmethod
+    def estimate_tokens(*texts: str, completion_tokens: int = 0) -> int:
+        """Rough token estimate (~4 characters per token) for budgeting."""
+        return sum(len(text) for text in texts) // 4 + completion_tokens
+
+    def _backoff_delay(self, attempt: int, error: Exception) -> float:
+        retry_after = _retry_after_seconds(error)
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.base_delay)
+        # Full jitter
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def run(
+        self,
+        call: Callable[[], Awaitable[Any]],
+        estimated_tokens: int = 0,
+        stats: Optional[Dict[str, Any]] = None
+    ) -> Any:
+        """Run call() under the concurrency cap and rate budgets, retrying on rate limits.
+
+        ``call`` must create a fresh awaitable each time it is invoked.
+        Non-rate-limit errors, and rate-limit errors after max_retries, are
+        counted as drops and re-raised.
+        """
+        stats = stats if stats is not None else self.new_stats()
+        stats["submitted"] += 1
+        stats["estimated_tokens"] += estimated_tokens
+        attempt = 0
+        while True:
+            async with self._semaphore:
+                if self.request_budget:
+                    await self.request_budget.acquire(1)
+                if self.token_budget and estimated_tokens:
+                    await self.token_budget.acquire(estimated_tokens)
+                try:
+                    result = await call()
+                    stats["succeeded"] += 1
+                    return result
+                except Exception as e:
+                    if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                        stats["dropped"] += 1
+                        raise
+                    stats["rate_limited"] += 1
+                    delay = self._backoff_delay(attempt, e)
+            # Back off outside the semaphore so other calls can proceed
+            attempt += 1
+            stats["retries"] += 1
+            logger.warning(f"Rate limited, retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
@@ -1,80 +1,113 @@
 # services/pdf_processor.py
 import json
 import os
+import time
 import logging
 import aiofiles
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
 from langchain_community.document_loaders import PyPDFLoader
+from langchain.schema import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.vectorstores import FAISS
 import asyncio
 from ..utils.config import Config
+from ..utils.cache import LRUCache
+from ..utils.paragraph_store import ParagraphStoreReader, ParagraphStoreWriter, store_path_for
 from .rag_service import UnifiedRAGService  # 导入UnifiedRAGService
 import re
 
+
+def _count_pdf_pages(file_path: str) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(file_path).pages)
+
+
+def _extract_page_range(file_path: str, start: int, end: int, keywords: Tuple[str, ...]) -> List[Tuple[int, str, bool]]:
+    """在子进程中提取 [start, end) 页的文本，并标记是否命中章节关键词"""
+    from pypdf import PdfReader
+    reader = PdfReader(file_path)
+    extracted = []
+    for page_number in range(start, end):
+        text = reader.pages[page_number].extract_text() or ""
+        text_lower = text.lower()
+        extracted.append((page_number, text, any(kw in text_lower for kw in keywords)))
+    return extracted
+
+
 class PDFProcessorService:
-    def __init__(self, config=None):
+    def __init__(self, config=None, rag_service: UnifiedRAGService = None):
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=config.get('chunk_size', 800),  # Default to 800 as per Streamlit
             chunk_overlap=config.get('chunk_overlap', 150)  # Default to 150 as per Streamlit
         )
-        self.rag_service = UnifiedRAGService(config=config)  # Pass config to RAG service
+        # 优先复用外部传入的RAG服务，避免重复加载模型和客户端
+        self.rag_service = rag_service or UnifiedRAGService(config=config)  # Pass config to RAG service
         self.section_keywords = [
             "risk factors", "item 1a", "item 7", "management’s discussion", "footnotes", "note"
         ]
+        self.extraction_workers = config.get('pdf_extraction_workers', 0)
+        self.parallel_min_pages = config.get('pdf_parallel_min_pages', 40)
+        self._executor = None
+        self.paragraph_cache = LRUCache(maxsize=config.get('paragraph_cache_size', 32))
+        # (文档ID, 用户ID) -> 实际存放段落/向量数据库的文档ID（去重上传指向规范文档），
+        # 用户不拥有该文档时返回None；由应用层注入
+        self.document_resolver: Optional[Callable[[str, str], Awaitable[Optional[str]]]] = None
+
+    async def process_pdf(
+        self,
+        file_path: str,
+        document_id: str,
+        metadata: dict,
+        save_vectorstore: bool = False,
+        vectorstore_path: str = None
+    ) -> dict:
+        """处理PDF，分割成所有段落，构建RAG向量数据库，过滤有用部分
 
-    async def process_pdf(self, file_path: str, document_id: str, metadata: dict, save_vectorstore: bool = False, vectorstore_path: str = None) -> dict:
-        """处理PDF，分割成所有段落，构建RAG向量数据库，过滤有用部分"""
+        段落按页流式产生，每处理完一页即追加写入存储文件；仅在需要构建向量数据库时
+        才在内存中保留全部段落，否则峰值内存只与单页大小相关。返回段落数量而非段落本身。
+        """
+        writer = None
         try:
             start_time = time.time()
             logging.info(f"开始处理PDF: {file_path}")
 
-            # 加载PDF
-            loader = PyPDFLoader(file_path)
-            pages = await loader.aload()
+            # 文档级元数据只存一次，段落只记录页码和章节
+            storage_path = store_path_for(Config.STORAGE_PATH, document_id)
+            writer = ParagraphStoreWriter(storage_path, document_id, metadata)
 
-            # 过滤有用部分
-            filtered_docs = []
-            for page in pages:
-                if any(kw.lower() in page.page_content.lower() for kw in self.section_keywords):
-                    filtered_docs.append(page)
-
-            if not filtered_docs:
-                logging.warning(f"No useful sections found in {file_path}")
-                filtered_docs = pages  # Fallback to all pages if no matches
-
-            # 分割成段落
             documents = []
             document_metadata = []
-            for doc in filtered_docs:
-                chunks = self.text_splitter.split_text(doc.page_content)
-                section_name = self._identify_section(doc.page_content) or metadata.get("section", "general")
-                for chunk in chunks:
-                    documents.append(chunk)
-                    document_metadata.append({
-                        **metadata,
-                        "page_number": doc.metadata.get("page", 0),
-                        "section_name": section_name
-                    })
+            paragraphs_count = 0
+            async for page_paragraphs in self.iter_paragraphs(file_path, metadata):
+                # 逐页追加写入段落
+                for paragraph in page_paragraphs:
+                    writer.append(
+                        paragraph["content"],
+                        paragraph["metadata"]["page_number"],
+                        paragraph["metadata"]["section_name"]
+                    )
+                    if save_vectorstore:
+                        documents.append(paragraph["content"])
+                        document_metadata.append(paragraph["metadata"])
+                paragraphs_count += len(page_paragraphs)
+            # 写入完成后原子替换，读取方不会看到半成品
+            writer.close()
+            writer = None
 
-            # 保存处理后的数据为JSON
             processed_data = {
                 "document_id": document_id,
-                "paragraphs": [
-                    {"content": doc, "metadata": meta} for doc, meta in zip(documents, document_metadata)
-                ]
+                "paragraphs_count": paragraphs_count,
+                "storage_path": str(storage_path)
             }
-            storage_path = Path(Config.STORAGE_PATH) / f"{document_id}.json"
-            storage_path.parent.mkdir(parents=True, exist_ok=True)
-            async with aiofiles.open(storage_path, 'w', encoding='utf-8') as f:
-                await f.write(json.dumps(processed_data, indent=2, ensure_ascii=False))
 
-            logging.info(f"处理了 {len(documents)} 个片段，保存到 {storage_path}")
+            logging.info(f"处理了 {paragraphs_count} 个片段，保存到 {storage_path}")
 
             # 构建RAG向量数据库
-            vectorstore = None
             if save_vectorstore:
-                vectorstore = await self.rag_service.build_enhanced_vectorstore(
+                await self.rag_service.build_enhanced_vectorstore(
                     documents=documents,
                     document_metadata=document_metadata,
                     save_path=vectorstore_path or f"{Config.STORAGE_PATH}/{document_id}_vectorstore"
@@ -91,12 +124,106 @@ class PDFProcessorService:
         except Exception as e:
             logging.error(f"处理PDF {file_path} 时出错: {e}", exc_info=True)
             raise
+        finally:
+            if writer is not None:
+                writer.abort()
 
-    async def query_pdf(self, document_id: str, query: str, vectorstore_path: str = None) -> dict:
+    async def iter_paragraphs(self, file_path: str, metadata: dict) -> AsyncIterator[List[dict]]:
+        """逐页产生段落列表：关键词过滤 -> 章节识别 -> 文本分割"""
+        async for page in self._iter_filtered_pages(file_path):
+            chunks = self.text_splitter.split_text(page.page_content)
+            section_name = self._identify_section(page.page_content) or metadata.get("section", "general")
+            yield [
+                {
+                    "content": chunk,
+                    "metadata": {
+                        **metadata,
+                        "page_number": page.metadata.get("page", 0),
+                        "section_name": section_name
+                    }
+                }
+                for chunk in chunks
+            ]
+
+    async def _iter_filtered_pages(self, file_path: str) -> AsyncIterator[Document]:
+        """按页产生命中章节关键词的页面
+
+        在第一个命中页出现之前缓存未命中的页面；若整份文档都没有命中，则回退为产生全部页面。
+        """
+        keywords = tuple(kw.lower() for kw in self.section_keywords)
+        unmatched = []
+        any_matched = False
+        async for page, matched in self._iter_pages(file_path, keywords):
+            if matched:
+                any_matched = True
+                unmatched = []
+                yield page
+            elif not any_matched:
+                unmatched.append(page)
+
+        if not any_matched:
+            logging.warning(f"No useful sections found in {file_path}")
+            for page in unmatched:  # Fallback to all pages if no matches
+                yield page
+
+    async def _iter_pages(self, file_path: str, keywords: Tuple[str, ...]) -> AsyncIterator[Tuple[Document, bool]]:
+        """按页码顺序产生 (页面, 是否命中关键词)；页数较多时使用进程池并行提取"""
+        page_count = 0
+        if self.extraction_workers > 1:
+            page_count = await asyncio.to_thread(_count_pdf_pages, file_path)
+
+        if page_count >= self.parallel_min_pages:
+            async for page_number, text, matched in self._extract_pages_parallel(file_path, page_count, keywords):
+                yield Document(page_content=text, metadata={"source": file_path, "page": page_number}), matched
+        else:
+            pages = PyPDFLoader(file_path).lazy_load()
+            while True:
+                page = await asyncio.to_thread(next, pages, None)
+                if page is None:
+                    break
+                yield page, any(kw in page.page_content.lower() for kw in keywords)
+
+    async def _extract_pages_parallel(self, file_path: str, page_count: int, keywords: Tuple[str, ...]) -> AsyncIterator[Tuple[int, str, bool]]:
+        """将页码范围切分给进程池，按页码顺序产出结果"""
+        if self._executor is None:
+            # 本进程已有线程（事件循环默认线程池、aiosqlite、httpx），fork 可能在子进程中死锁；
+            # 改用 forkserver（不支持的平台上用 spawn）
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.extraction_workers,
+                mp_context=multiprocessing.get_context(start_method)
+            )
+
+        batch_size = -(-page_count // self.extraction_workers)
+        loop = asyncio.get_running_loop()
+        futures = [
+            loop.run_in_executor(
+                self._executor, _extract_page_range, file_path, start, min(start + batch_size, page_count), keywords
+            )
+            for start in range(0, page_count, batch_size)
+        ]
+        logging.info(f"并行提取 {page_count} 页，使用 {len(futures)} 个批次")
+        # 按提交顺序等待，保证页码顺序确定；前面的批次完成后即可向下游产出
+        try:
+            for future in futures:
+                for page in await future:
+                    yield page
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def shutdown(self):
+        """关闭PDF提取进程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def query_pdf(self, document_id: str, query: str, user_id: str, vectorstore_path: str = None) -> dict:
         """对已处理的PDF执行RAG查询"""
         try:
             # 加载向量数据库
-            vectorstore_path = vectorstore_path or f"{Config.STORAGE_PATH}/{document_id}_vectorstore"
+            storage_id = await self._storage_document_id(document_id, user_id)
+            vectorstore_path = vectorstore_path or f"{Config.STORAGE_PATH}/{storage_id}_vectorstore"
             vectorstore = await asyncio.to_thread(
                 FAISS.load_local,
                 vectorstore_path,
@@ -112,6 +239,130 @@ class PDFProcessorService:
             logging.error(f"查询PDF {document_id} 时出错: {e}", exc_info=True)
             raise
 
+    async def get_document_paragraphs(
+        self,
+        document_id: str,
+        user_id: str,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        section: Optional[str] = None,
+        page_start: Optional[int] = None,
+        page_end: Optional[int] = None
+    ) -> List[dict]:
+        """读取已处理文档的段落，支持章节/页码过滤和分页"""
+        result = await self.query_document_paragraphs(
+            document_id, user_id, offset=offset, limit=limit,
+            section=section, page_start=page_start, page_end=page_end
+        )
+        return result["paragraphs"]
+
+    async def query_document_paragraphs(
+        self,
+        document_id: str,
+        user_id: str,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        section: Optional[str] = None,
+        page_start: Optional[int] = None,
+        page_end: Optional[int] = None
+    ) -> dict:
+        """过滤并分页，返回段落及过滤后的总数
+
+        section 为大小写不敏感的子串匹配；page_start/page_end 为闭区间。
+        """
+        paragraphs = await self._load_document_paragraphs(document_id, user_id)
+
+        if section is not None or page_start is not None or page_end is not None:
+            section_lower = section.lower() if section is not None else None
+            paragraphs = [
+                p for p in paragraphs
+                if (section_lower is None or section_lower in p["section_name"].lower())
+                and (page_start is None or p["page_number"] >= page_start)
+                and (page_end is None or p["page_number"] <= page_end)
+            ]
+
+        stop = offset + limit if limit is not None else None
+        return {
+            "document_id": document_id,
+            "total": len(paragraphs),
+            "offset": offset,
+            "limit": limit,
+            # 返回副本，避免调用方修改缓存中的段落
+            "paragraphs": [dict(p) for p in paragraphs[offset:stop]]
+        }
+
+    def paragraph_cache_stats(self) -> dict:
+        """段落缓存命中统计"""
+        return self.paragraph_cache.stats()
+
+    async def _load_document_paragraphs(self, document_id: str, user_id: str) -> List[dict]:
+        """加载用户文档的全部段落，按 (存储文档ID, 文件mtime) 缓存解析结果"""
+        # 每次读取都先校验归属，缓存命中也不例外
+        document_id = await self._storage_document_id(document_id, user_id)
+        store_path = store_path_for(Config.STORAGE_PATH, document_id)
+        legacy_path = Path(Config.STORAGE_PATH) / f"{document_id}.json"
+        path = store_path if store_path.exists() else legacy_path
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Processed document {document_id} not found")
+
+        cache_key = (document_id, mtime)
+        paragraphs = self.paragraph_cache.get(cache_key)
+        if paragraphs is not None:
+            return paragraphs
+
+        if path == store_path:
+            def _read():
+                with ParagraphStoreReader(store_path) as reader:
+                    return [
+                        {
+                            "paragraph_index": i,
+                            "text": reader.text(i),
+                            "page_number": reader.pages[i],
+                            "section_name": reader.sections[reader.section_ids[i]]
+                        }
+                        for i in range(len(reader))
+                    ]
+            paragraphs = await asyncio.to_thread(_read)
+        else:
+            # 兼容旧版JSON存储
+            async with aiofiles.open(legacy_path, 'r', encoding='utf-8') as f:
+                data = json.loads(await f.read())
+            paragraphs = [
+                {
+                    "paragraph_index": i,
+                    "text": paragraph["content"],
+                    "page_number": paragraph["metadata"].get("page_number", 0),
+                    "section_name": paragraph["metadata"].get("section_name", "general")
+                }
+                for i, paragraph in enumerate(data["paragraphs"])
+            ]
+
+        # 同一文档的旧版本（mtime不同）不再有效
+        self.paragraph_cache.invalidate(lambda key: key[0] == document_id)
+        self.paragraph_cache.put(cache_key, paragraphs)
+        return paragraphs
+
+    async def _storage_document_id(self, document_id: str, user_id: str) -> str:
+        """去重上传的文档复用规范文档的产物；未注入解析器时即为自身
+
+        用户不拥有该文档时抛出 FileNotFoundError，与文档不存在无法区分。
+        """
+        if self.document_resolver is None:
+            return document_id
+        storage_id = await self.document_resolver(document_id, user_id)
+        if storage_id is None:
+            raise FileNotFoundError(f"Processed document {document_id} not found")
+        return storage_id
+
+    def has_processed_document(self, document_id: str) -> bool:
+        """文档的段落文件是否存在（可被去重上传复用）"""
+        return (
+            store_path_for(Config.STORAGE_PATH, document_id).exists()
+            or (Path(Config.STORAGE_PATH) / f"{document_id}.json").exists()
+        )
+
     def _identify_section(self, content: str) -> str:
         """识别文档章节"""
         section_patterns = [
@@ -5,6 +5,7 @@
 """
 
 import asyncio
+import hashlib
 import json
 import time
 import os
@@ -25,6 +26,14 @@ from langchain.schema.runnable import RunnablePassthrough
 from langchain.schema.output_parser import StrOutputParser
 from langchain.chains import RetrievalQA
 
+from .llm_registry import LLMRegistry, get_llm_registry
+from .llm_scheduler import LLMScheduler
+from ..utils.rag_config import RAGConfig
+from ..utils.result_cache import AnalysisResultCache
+from ..utils.embedding_cache import EmbeddingCache
+from ..utils.keyword_matcher import KeywordMatcher
+from ..utils.entity_patterns import RISK_ENTITY_PATTERNS, EntityExtractor, clean_text
+
 # NLP imports
 try:
     import spacy
@@ -48,7 +57,19 @@ load_dotenv()
 class UnifiedRAGService:
     """统一的RAG服务，整合简单和高级功能"""
     
-    def __init__(self, config: Dict[str, Any] = None):
+    CHUNK_SUMMARY_TEMPLATE = """
+            请为以下金融文档片段生成一个简洁的摘要（不超过50字）：
+            文档片段：{chunk}
+            摘要：
+            """
+    # 摘要缓存键包含模板哈希，修改模板后旧摘要自动失效
+    CHUNK_SUMMARY_VERSION = hashlib.sha256(CHUNK_SUMMARY_TEMPLATE.encode("utf-8")).hexdigest()[:12]
+    
+    # 语义特征保留的实体类型；关键词只取其中的子集
+    ENTITY_LABELS = ("ORG", "MONEY", "PERCENT", "DATE", "LAW", "PERSON")
+    KEYWORD_ENTITY_LABELS = ("ORG", "MONEY", "PERCENT", "LAW", "PERSON")
+    
+    def __init__(self, config: Dict[str, Any] = None, llm_registry: LLMRegistry = None):
         # 默认配置
         self.config = {
             "chunk_size": 1000,
@@ -61,17 +82,19 @@ class UnifiedRAGService:
             "use_reranking": True,
             "use_compression": True,
             "enable_multi_query": True,
-            "model_name": "gpt-4o"
+            "model_name": "gpt-4o",
+            "spacy_batch_size": 64,
+            "spacy_n_process": 1
         }
         
         # 合并自定义配置
         if config:
             self.config.update(config)
         
-        # 初始化LLM
-        self.llm = ChatOpenAI(
-            model=self.config["model_name"],
-            api_key=os.getenv("OPENAI_API_KEY", ""),
+        # 初始化LLM（与风险分析服务共享客户端池和已编译的提示词）
+        self.llm_registry = llm_registry or get_llm_registry(self.config)
+        self.llm = self.llm_registry.get_client(
+            self.config["model_name"],
             temperature=self.config["llm_temperature"],
             max_tokens=self.config["max_tokens"]
         )
@@ -81,6 +104,14 @@ class UnifiedRAGService:
             api_key=os.getenv("OPENAI_API_KEY", "")
         )
         
+        # 按(模型, 文本哈希)持久缓存的向量，重建/重复上传时只为新文本调用embedding接口
+        self.embedding_cache = None
+        if self.config.get("embedding_cache_enabled", RAGConfig.EMBEDDING_CACHE_ENABLED):
+            self.embedding_cache = EmbeddingCache(
+                self.config.get("embedding_cache_dir", RAGConfig.EMBEDDING_CACHE_DIR),
+                getattr(self.embedding_model, "model", "default")
+            )
+        
         # 初始化文本分割器
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=self.config["chunk_size"],
@@ -108,9 +139,30 @@ class UnifiedRAGService:
         self.financial_keywords = self._load_financial_keywords()
         self.risk_entities = self._load_risk_entities()
         
+        # 实体模式预编译为单个正则（每种模式一个命名分组），每段文本只扫描一遍
+        self.entity_extractor = EntityExtractor(self.risk_entities)
+        
+        # 所有关键词词典编译为一个多模式匹配自动机，每段文本只扫描一遍
+        self.keyword_matcher = KeywordMatcher({
+            **self.financial_keywords,
+            **self._load_sentiment_indicators()
+        })
+        
         # 缓存
         self.vectorstore_cache = {}
         self.query_cache = {}
+        
+        # chunk摘要：按chunk文本哈希持久缓存，跨多次构建复用
+        self.summary_cache = None
+        if self.config.get("summary_cache_enabled", RAGConfig.SUMMARY_CACHE_ENABLED):
+            self.summary_cache = AnalysisResultCache(
+                db_path=self.config.get("summary_cache_path", RAGConfig.SUMMARY_CACHE_PATH),
+                max_bytes=self.config.get("summary_cache_max_mb", RAGConfig.SUMMARY_CACHE_MAX_MB) * 1024 * 1024
+            )
+        # LLM调用的并发上限和RPM/TPM预算（风险分析服务复用同一个调度器）
+        self.scheduler = LLMScheduler.from_config(self.config)
+        # 延迟生成的摘要回填任务
+        self.summary_backfills = set()
 
     def _load_financial_keywords(self) -> Dict[str, List[str]]:
         """加载金融关键词词典"""
@@ -138,39 +190,36 @@ class UnifiedRAGService:
             ]
         }
 
-    def _load_risk_entities(self) -> Dict[str, Any]:
-        """加载风险实体识别模式"""
+    def _load_sentiment_indicators(self) -> Dict[str, List[str]]:
+        """加载情感指标词典"""
         return {
-            "monetary_patterns": [
-                r'\$[\d,]+(?:\.\d{2})?(?:\s*(?:million|billion|thousand|M|B|K))?',
-                r'(?:USD|dollars?)\s*[\d,]+(?:\.\d{2})?',
-                r'[\d,]+(?:\.\d{2})?\s*(?:million|billion|thousand)\s*(?:dollars?|USD)?'
+            "negative_sentiment": [
+                "risk", "loss", "decline", "decrease", "negative", "adverse", "concern", "issue", "problem", "threat"
             ],
-            "percentage_patterns": [
-                r'\d+(?:\.\d+)?%',
-                r'\d+(?:\.\d+)?\s*percent',
-                r'percentage\s*of\s*\d+(?:\.\d+)?'
-            ],
-            "date_patterns": [
-                r'\d{4}',  # 年份
-                r'(?:January|February|March|April|May|June|July|August|September|October|November|December)\s*\d{1,2},?\s*\d{4}',
-                r'\d{1,2}/\d{1,2}/\d{4}',
-                r'\d{4}-\d{2}-\d{2}'
-            ],
-            "risk_severity_patterns": [
-                r'(?:high|medium|low|significant|material|substantial)\s*(?:risk|exposure|threat)',
-                r'(?:critical|severe|moderate|minor)\s*(?:risk|impact|concern)'
+            "positive_sentiment": [
+                "improve", "increase", "growth", "positive", "strong", "effective", "successful", "opportunity"
             ]
         }
 
+    def _load_risk_entities(self) -> Dict[str, Any]:
+        """加载风险实体识别模式"""
+        return {group: list(patterns) for group, patterns in RISK_ENTITY_PATTERNS.items()}
+
     async def build_enhanced_vectorstore(
         self, 
         documents: List[str], 
         document_metadata: List[Dict[str, Any]], 
-        save_path: Optional[str] = None
+        save_path: Optional[str] = None,
+        defer_summaries: Optional[bool] = None
     ) -> FAISS:
-        """构建增强的向量数据库"""
+        """构建增强的向量数据库
+
+        defer_summaries 为 True 时先用截断文本作为摘要完成构建，向量库立即可查询，
+        LLM摘要在后台生成后回填到向量库元数据（及保存的文件）中。
+        """
         logging.info("🔄 开始构建增强向量数据库...")
+        if defer_summaries is None:
+            defer_summaries = self.config.get("defer_chunk_summaries", RAGConfig.DEFER_CHUNK_SUMMARIES)
         
         try:
             # 预处理文档
@@ -180,32 +229,28 @@ class UnifiedRAGService:
             chunks = await self._intelligent_chunking(processed_docs)
             
             # 增强chunks
-            enhanced_chunks = await self._enhance_chunks_with_entities(chunks)
+            enhanced_chunks = await self._enhance_chunks_with_entities(chunks, defer_summaries=defer_summaries)
             
-            # 构建向量数据库
+            # 构建向量数据库（向量来自缓存+批量embedding，直接用组装好的矩阵建索引）
+            contents = [chunk["content"] for chunk in enhanced_chunks]
+            embeddings = await self._embed_texts(contents)
             vectorstore = await asyncio.to_thread(
-                FAISS.from_texts,
-                [chunk["content"] for chunk in enhanced_chunks],
+                FAISS.from_embeddings,
+                list(zip(contents, embeddings)),
                 self.embedding_model,
                 metadatas=[chunk["metadata"] for chunk in enhanced_chunks]
             )
             
             # 保存到本地（如果指定了路径）
             if save_path:
-                await asyncio.to_thread(vectorstore.save_local, save_path)
-                
-                # 保存元数据
-                metadata_path = f"{save_path}_metadata.json"
-                metadata_info = {
-                    "chunks": enhanced_chunks,
-                    "build_time": datetime.now().isoformat(),
-                    "config": self.config,
-                    "total_chunks": len(enhanced_chunks),
-                    "documents_count": len(documents)
-                }
-                
-                with open(metadata_path, 'w', encoding='utf-8') as f:
-                    json.dump(metadata_info, f, ensure_ascii=False, indent=2)
+                await self._save_vectorstore(vectorstore, enhanced_chunks, save_path, len(documents))
+            
+            if defer_summaries:
+                task = asyncio.create_task(
+                    self._backfill_chunk_summaries(vectorstore, enhanced_chunks, save_path, len(documents))
+                )
+                self.summary_backfills.add(task)
+                task.add_done_callback(self.summary_backfills.discard)
             
             logging.info(f"✅ 向量数据库构建完成，包含 {len(enhanced_chunks)} 个增强块")
             return vectorstore
@@ -214,6 +259,113 @@ class UnifiedRAGService:
             logging.error(f"构建向量数据库失败: {e}")
             raise
 
+    async def _embed_texts(self, texts: List[str]) -> np.ndarray:
+        """批量计算文本向量：去重 -> 查磁盘缓存 -> 未命中的分批并发请求embedding -> 写回缓存，返回float32矩阵"""
+        unique_texts = list(dict.fromkeys(texts))
+        keys = [EmbeddingCache.make_key(text) for text in unique_texts]
+        vectors: Dict[str, np.ndarray] = {}
+        
+        if self.embedding_cache is not None:
+            try:
+                vectors = await asyncio.to_thread(self.embedding_cache.get_many, keys)
+            except Exception as e:
+                logging.warning(f"读取embedding缓存失败: {e}")
+        
+        missing = [(key, text) for key, text in zip(keys, unique_texts) if key not in vectors]
+        if missing:
+            batch_size = self.config.get("embedding_batch_size", RAGConfig.EMBEDDING_BATCH_SIZE)
+            semaphore = asyncio.Semaphore(self.config.get("embedding_concurrency", RAGConfig.EMBEDDING_CONCURRENCY))
+            batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+            
+            async def embed(batch: List[Tuple[str, str]]) -> List[List[float]]:
+                async with semaphore:
+                    return await self.embedding_model.aembed_documents([text for _, text in batch])
+            
+            results = await asyncio.gather(*(embed(batch) for batch in batches))
+            new_keys = [key for batch in batches for key, _ in batch]
+            new_vectors = np.asarray(
+                [vector for embedded in results for vector in embedded], dtype=np.float32
+            )
+            vectors.update(zip(new_keys, new_vectors))
+            
+            if self.embedding_cache is not None:
+                try:
+                    await asyncio.to_thread(self.embedding_cache.put_many, new_keys, new_vectors)
+                except Exception as e:
+                    logging.warning(f"写入embedding缓存失败: {e}")
+        
+        logging.info(
+            f"embedding: {len(texts)} 个文本, {len(unique_texts)} 个不重复, "
+            f"{len(unique_texts) - len(missing)} 个缓存命中, {len(missing)} 个新请求"
+        )
+        by_text = dict(zip(unique_texts, keys))
+        return np.stack([vectors[by_text[text]] for text in texts]) if texts else np.zeros((0, 0), dtype=np.float32)
+
+    async def _save_vectorstore(
+        self,
+        vectorstore: FAISS,
+        enhanced_chunks: List[Dict[str, Any]],
+        save_path: str,
+        documents_count: int
+    ):
+        """保存向量数据库及其元数据"""
+        await asyncio.to_thread(vectorstore.save_local, save_path)
+        
+        # 保存元数据
+        metadata_path = f"{save_path}_metadata.json"
+        metadata_info = {
+            "chunks": enhanced_chunks,
+            "build_time": datetime.now().isoformat(),
+            "config": self.config,
+            "total_chunks": len(enhanced_chunks),
+            "documents_count": documents_count
+        }
+        
+        def write_metadata():
+            with open(metadata_path, 'w', encoding='utf-8') as f:
+                json.dump(metadata_info, f, ensure_ascii=False, indent=2)
+        
+        await asyncio.to_thread(write_metadata)
+
+    async def _backfill_chunk_summaries(
+        self,
+        vectorstore: FAISS,
+        enhanced_chunks: List[Dict[str, Any]],
+        save_path: Optional[str],
+        documents_count: int
+    ):
+        """后台生成chunk摘要并回填到向量库文档元数据"""
+        try:
+            summaries = await self._summarize_chunks([chunk["content"] for chunk in enhanced_chunks])
+            # FAISS.from_embeddings 按输入顺序分配索引位置（position -> docstore id）
+            for position, (chunk, summary) in enumerate(zip(enhanced_chunks, summaries)):
+                chunk["metadata"]["summary"] = summary
+                chunk["metadata"].pop("summary_pending", None)
+                doc = vectorstore.docstore.search(vectorstore.index_to_docstore_id[position])
+                if isinstance(doc, Document):
+                    doc.metadata["summary"] = summary
+                    doc.metadata.pop("summary_pending", None)
+            if save_path:
+                await self._save_vectorstore(vectorstore, enhanced_chunks, save_path, documents_count)
+            logging.info(f"✅ 已回填 {len(summaries)} 个chunk摘要")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"回填chunk摘要失败: {e}")
+
+    async def wait_for_summary_backfills(self):
+        """等待所有后台摘要回填完成"""
+        if self.summary_backfills:
+            await asyncio.gather(*list(self.summary_backfills), return_exceptions=True)
+
+    async def aclose(self):
+        """取消未完成的摘要回填并关闭摘要缓存"""
+        for task in list(self.summary_backfills):
+            task.cancel()
+        await self.wait_for_summary_backfills()
+        if self.summary_cache is not None:
+            await self.summary_cache.close()
+
     async def _preprocess_documents(self, documents: List[str], metadata: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """智能文档预处理"""
         processed = []
@@ -244,21 +396,8 @@ class UnifiedRAGService:
         return processed
 
     def _clean_text(self, text: str) -> str:
-        """文本清理"""
-        # 标准化空白字符
-        text = re.sub(r'\s+', ' ', text)
-        
-        # 标准化引号
-        text = text.replace('"', '"').replace('"', '"').replace(''', "'").replace(''', "'")
-        
-        # 移除页码
-        text = re.sub(r'Page \d+ of \d+', '', text)
-        text = re.sub(r'\d+\s*$', '', text, flags=re.MULTILINE)
-        
-        # 修正常见OCR错误
-        text = text.replace('l0', '10').replace('O0', '00')
-        
-        return text.strip()
+        """文本清理：标准化空白和引号、移除页码、修正常见OCR错误"""
+        return clean_text(text)
 
     def _identify_document_sections(self, text: str) -> List[str]:
         """识别文档章节"""
@@ -281,39 +420,20 @@ class UnifiedRAGService:
 
     def _extract_key_information(self, text: str) -> Dict[str, Any]:
         """提取关键信息"""
+        # 货币金额、百分比、日期和风险严重程度一次扫描提取
         key_info = {
-            "monetary_amounts": [],
-            "percentages": [],
-            "dates": [],
+            **self.entity_extractor.extract(text),
             "risk_mentions": [],
             "regulatory_references": []
         }
         
-        # 提取货币金额
-        for pattern in self.risk_entities["monetary_patterns"]:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            key_info["monetary_amounts"].extend(matches[:10])
-        
-        # 提取百分比
-        for pattern in self.risk_entities["percentage_patterns"]:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            key_info["percentages"].extend(matches[:15])
-        
-        # 提取日期
-        for pattern in self.risk_entities["date_patterns"]:
-            matches = re.findall(pattern, text)
-            key_info["dates"].extend(matches[:10])
+        keyword_hits = self.keyword_matcher.scan(text)
         
         # 识别风险类型
-        text_lower = text.lower()
-        for risk_type in self.financial_keywords["risk_types"]:
-            if risk_type in text_lower:
-                key_info["risk_mentions"].append(risk_type)
+        key_info["risk_mentions"].extend(keyword_hits["risk_types"])
         
         # 识别监管引用
-        for regulation in self.financial_keywords["regulations"]:
-            if regulation.lower() in text_lower:
-                key_info["regulatory_references"].append(regulation)
+        key_info["regulatory_references"].extend(keyword_hits["regulations"])
         
         return key_info
 
@@ -321,26 +441,72 @@ class UnifiedRAGService:
         """智能分块策略"""
         all_chunks = []
         
-        for doc in documents:
-            content = doc["content"]
-            metadata = doc["metadata"]
-            
-            # 基础分块
-            base_chunks = self.text_splitter.split_text(content)
-            
+        # 基础分块
+        base_chunks = [self.text_splitter.split_text(doc["content"]) for doc in documents]
+        
+        # 所有文档的chunk一次性批量跑spacy，每个chunk只解析一次
+        entities = await self._extract_entities_batch(
+            [chunk for chunks in base_chunks for chunk in chunks]
+        )
+        
+        offset = 0
+        for doc, chunks in zip(documents, base_chunks):
             # 语义增强分块
-            semantic_chunks = await self._semantic_chunking(base_chunks, metadata)
+            semantic_chunks = await self._semantic_chunking(
+                chunks, doc["metadata"], entities[offset:offset + len(chunks)]
+            )
             all_chunks.extend(semantic_chunks)
+            offset += len(chunks)
         
         return all_chunks
 
-    async def _semantic_chunking(self, chunks: List[str], base_metadata: Dict[str, Any]) -> List[Dict[str, Any]]:
+    def _spacy_disabled_components(self) -> List[str]:
+        """实体识别用不到的pipeline组件（保留tok2vec供ner使用）"""
+        return [name for name in self.nlp.pipe_names if name not in ("tok2vec", "ner")]
+
+    def _doc_entities(self, doc) -> List[Dict[str, str]]:
+        return [
+            {"text": ent.text, "label": ent.label_}
+            for ent in doc.ents
+            if ent.label_ in self.ENTITY_LABELS
+        ]
+
+    async def _extract_entities_batch(self, chunks: List[str]) -> List[Optional[List[Dict[str, str]]]]:
+        """使用nlp.pipe批量提取实体，返回与chunks一一对应的实体列表（spacy不可用时为None）"""
+        if not self.nlp or not chunks:
+            return [None] * len(chunks)
+        
+        def run_pipe():
+            docs = self.nlp.pipe(
+                chunks,
+                batch_size=self.config.get("spacy_batch_size", 64),
+                n_process=max(1, self.config.get("spacy_n_process", 1)),
+                disable=self._spacy_disabled_components()
+            )
+            return [self._doc_entities(doc) for doc in docs]
+        
+        try:
+            return await asyncio.to_thread(run_pipe)
+        except Exception as e:
+            logging.warning(f"批量实体提取失败: {e}")
+            return [None] * len(chunks)
+
+    async def _semantic_chunking(
+        self,
+        chunks: List[str],
+        base_metadata: Dict[str, Any],
+        entities: Optional[List[Optional[List[Dict[str, str]]]]] = None
+    ) -> List[Dict[str, Any]]:
         """基于语义的智能分块"""
         enhanced_chunks = []
         
         for i, chunk in enumerate(chunks):
+            keyword_hits = self.keyword_matcher.scan(chunk)
+            
             # 分析语义特征
-            semantic_features = await self._analyze_chunk_semantics(chunk)
+            semantic_features = await self._analyze_chunk_semantics(
+                chunk, entities[i] if entities else None, keyword_hits
+            )
             
             # 分类chunk类型
             chunk_type = self._classify_chunk_type(chunk, semantic_features)
@@ -359,9 +525,7 @@ class UnifiedRAGService:
                     "word_count": len(chunk.split()),
                     "has_numbers": bool(re.search(r'\d', chunk)),
                     "has_risk_keywords": any(
-                        keyword in chunk.lower() 
-                        for keyword_list in self.financial_keywords.values() 
-                        for keyword in keyword_list
+                        keyword_hits[category] for category in self.financial_keywords
                     )
                 }
             }
@@ -369,8 +533,13 @@ class UnifiedRAGService:
         
         return enhanced_chunks
 
-    async def _analyze_chunk_semantics(self, chunk: str) -> Dict[str, Any]:
-        """分析chunk的语义特征"""
+    async def _analyze_chunk_semantics(
+        self,
+        chunk: str,
+        entities: Optional[List[Dict[str, str]]] = None,
+        keyword_hits: Optional[Dict[str, List[str]]] = None
+    ) -> Dict[str, Any]:
+        """分析chunk的语义特征（entities / keyword_hits 可由调用方预先计算，缺省时在此计算）"""
         features = {
             "entities": [],
             "risk_signals": 0,
@@ -379,46 +548,33 @@ class UnifiedRAGService:
             "sentiment_indicators": []
         }
         
+        if entities is not None:
+            features["entities"] = entities
         # 使用spacy提取实体（如果可用）
-        if self.nlp:
+        elif self.nlp:
             try:
-                doc = self.nlp(chunk)
-                features["entities"] = [
-                    {"text": ent.text, "label": ent.label_} 
-                    for ent in doc.ents 
-                    if ent.label_ in ["ORG", "MONEY", "PERCENT", "DATE", "LAW", "PERSON"]
-                ]
+                doc = self.nlp(chunk, disable=self._spacy_disabled_components())
+                features["entities"] = self._doc_entities(doc)
             except Exception as e:
                 logging.warning(f"实体提取失败: {e}")
         
-        chunk_lower = chunk.lower()
+        if keyword_hits is None:
+            keyword_hits = self.keyword_matcher.scan(chunk)
         
         # 计算风险信号
-        for risk_indicator in self.financial_keywords["risk_indicators"]:
-            if risk_indicator in chunk_lower:
-                features["risk_signals"] += 1
+        features["risk_signals"] = len(keyword_hits["risk_indicators"])
         
         # 计算金融术语
-        for financial_term in self.financial_keywords["financial_metrics"]:
-            if financial_term in chunk_lower:
-                features["financial_terms"] += 1
+        features["financial_terms"] = len(keyword_hits["financial_metrics"])
         
         # 计算监管提及
-        for regulation in self.financial_keywords["regulations"]:
-            if regulation.lower() in chunk_lower:
-                features["regulatory_mentions"] += 1
+        features["regulatory_mentions"] = len(keyword_hits["regulations"])
         
         # 情感指标
-        negative_indicators = ["risk", "loss", "decline", "decrease", "negative", "adverse", "concern", "issue", "problem", "threat"]
-        positive_indicators = ["improve", "increase", "growth", "positive", "strong", "effective", "successful", "opportunity"]
-        
-        for indicator in negative_indicators:
-            if indicator in chunk_lower:
-                features["sentiment_indicators"].append(("negative", indicator))
-        
-        for indicator in positive_indicators:
-            if indicator in chunk_lower:
-                features["sentiment_indicators"].append(("positive", indicator))
+        features["sentiment_indicators"] = (
+            [("negative", indicator) for indicator in keyword_hits["negative_sentiment"]] +
+            [("positive", indicator) for indicator in keyword_hits["positive_sentiment"]]
+        )
         
         return features
 
@@ -482,19 +638,45 @@ class UnifiedRAGService:
         
         return min(score, 1.0)
 
-    async def _enhance_chunks_with_entities(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def keyword_category_counts(self, text: str) -> Dict[str, int]:
+        """统计文本命中各关键词类别的词条数（不调用spacy，用于低成本预筛选）"""
+        counts = self.keyword_matcher.counts(text)
+        return {category: counts[category] for category in self.financial_keywords}
+
+    def score_paragraph_importance(self, text: str, category_counts: Optional[Dict[str, int]] = None) -> float:
+        """基于关键词命中的段落重要性分数，复用 _calculate_importance_score"""
+        counts = category_counts if category_counts is not None else self.keyword_category_counts(text)
+        features = {
+            "entities": [],
+            "risk_signals": counts.get("risk_indicators", 0),
+            "financial_terms": counts.get("financial_metrics", 0),
+            "regulatory_mentions": counts.get("regulations", 0)
+        }
+        return self._calculate_importance_score(text, features)
+
+    async def _enhance_chunks_with_entities(
+        self,
+        chunks: List[Dict[str, Any]],
+        defer_summaries: bool = False
+    ) -> List[Dict[str, Any]]:
         """使用实体信息增强chunks"""
         enhanced = []
         
-        for chunk_data in chunks:
+        # 生成摘要（并发+缓存；延迟模式下先用截断文本占位）
+        contents = [chunk_data["content"] for chunk_data in chunks]
+        if defer_summaries:
+            summaries = [self._fallback_summary(chunk) for chunk in contents]
+        else:
+            summaries = await self._summarize_chunks(contents)
+        
+        for chunk_data, chunk_summary in zip(chunks, summaries):
             chunk = chunk_data["content"]
             metadata = chunk_data["metadata"]
             
-            # 生成摘要
-            chunk_summary = await self._generate_chunk_summary(chunk)
-            
-            # 提取关键词
-            keywords = self._extract_chunk_keywords(chunk)
+            # 提取关键词（复用语义分析阶段的实体，不再重复跑spacy）
+            keywords = self._extract_chunk_keywords(
+                chunk, metadata.get("semantic_features", {}).get("entities")
+            )
             
             enhanced_chunk = {
                 "content": chunk,
@@ -505,50 +687,97 @@ class UnifiedRAGService:
                     "enhanced_at": datetime.now().isoformat()
                 }
             }
+            if defer_summaries and len(chunk) >= 200:
+                enhanced_chunk["metadata"]["summary_pending"] = True
             enhanced.append(enhanced_chunk)
         
         return enhanced
 
-    async def _generate_chunk_summary(self, chunk: str) -> str:
-        """生成chunk摘要"""
-        if len(chunk) < 200:
-            return chunk[:100] + "..."
+    @staticmethod
+    def _fallback_summary(chunk: str) -> str:
+        return chunk[:100] + "..."
+
+    def _summary_cache_key(self, chunk: str) -> str:
+        # 按送入LLM的原文精确哈希：摘要输出区分大小写，不能复用分析缓存的归一化（小写化）键
+        # 前缀与旧版按归一化文本生成的 "chunk_summary:" 键不同，旧条目不会被误命中
+        chunk_hash = hashlib.sha256(chunk[:1000].encode("utf-8")).hexdigest()
+        return f"summary:{self.CHUNK_SUMMARY_VERSION}:{self.config['model_name']}:{chunk_hash}"
+
+    async def _summarize_chunks(self, chunks: List[str]) -> List[str]:
+        """批量生成chunk摘要：先查缓存，未命中的去重后以有限并发调用LLM，成功结果写回缓存"""
+        summaries: List[Optional[str]] = [None] * len(chunks)
+        pending: Dict[str, List[int]] = defaultdict(list)
         
-        try:
-            summary_prompt = ChatPromptTemplate.from_template("""
-            请为以下金融文档片段生成一个简洁的摘要（不超过50字）：
-            文档片段：{chunk}
-            摘要：
-            """)
+        for i, chunk in enumerate(chunks):
+            if len(chunk) < 200:
+                summaries[i] = self._fallback_summary(chunk)
+            else:
+                pending[self._summary_cache_key(chunk)].append(i)
+        
+        if pending and self.summary_cache is not None:
+            cached = await self.summary_cache.get_many(list(pending))
+            for key, entry in cached.items():
+                for i in pending.pop(key):
+                    summaries[i] = entry["summary"]
+        
+        if pending:
+            semaphore = asyncio.Semaphore(
+                self.config.get("chunk_summary_concurrency", RAGConfig.CHUNK_SUMMARY_CONCURRENCY)
+            )
             
-            chain = summary_prompt | self.llm | StrOutputParser()
-            summary = await asyncio.to_thread(chain.invoke, {"chunk": chunk[:1000]})
-            return summary.strip()
+            async def summarize(key: str) -> Tuple[str, Optional[str]]:
+                async with semaphore:
+                    try:
+                        return key, await self._llm_chunk_summary(chunks[pending[key][0]])
+                    except Exception as e:
+                        logging.warning(f"摘要生成失败: {e}")
+                        return key, None
             
-        except Exception as e:
-            logging.warning(f"摘要生成失败: {e}")
-            return chunk[:100] + "..."
+            generated = await asyncio.gather(*(summarize(key) for key in pending))
+            for key, summary in generated:
+                for i in pending[key]:
+                    summaries[i] = summary if summary is not None else self._fallback_summary(chunks[i])
+            
+            if self.summary_cache is not None:
+                await self.summary_cache.put_many({
+                    key: {"summary": summary} for key, summary in generated if summary is not None
+                })
+        
+        return summaries
 
-    def _extract_chunk_keywords(self, chunk: str) -> List[str]:
+    async def _llm_chunk_summary(self, chunk: str) -> str:
+        summary_prompt = self.llm_registry.compile_template(self.CHUNK_SUMMARY_TEMPLATE)
+        chain = summary_prompt | self.llm | StrOutputParser()
+        summary = await self.scheduler.run(
+            lambda: chain.ainvoke({"chunk": chunk[:1000]}),
+            estimated_tokens=LLMScheduler.estimate_tokens(
+                self.CHUNK_SUMMARY_TEMPLATE, chunk[:1000], completion_tokens=100
+            )
+        )
+        return summary.strip()
+
+    async def _generate_chunk_summary(self, chunk: str) -> str:
+        """生成chunk摘要"""
+        return (await self._summarize_chunks([chunk]))[0]
+
+    def _extract_chunk_keywords(self, chunk: str, entities: Optional[List[Dict[str, str]]] = None) -> List[str]:
         """提取chunk关键词"""
         keywords = []
-        chunk_lower = chunk.lower()
         
         # 从预定义词典提取关键词
-        for category, word_list in self.financial_keywords.items():
-            for word in word_list:
-                if word in chunk_lower:
-                    keywords.append(word)
+        keyword_hits = self.keyword_matcher.scan(chunk)
+        for category in self.financial_keywords:
+            keywords.extend(keyword_hits[category])
         
         # 使用NLP提取实体关键词
-        if self.nlp:
+        if entities is None and self.nlp:
             try:
-                doc = self.nlp(chunk)
-                for ent in doc.ents:
-                    if ent.label_ in ["ORG", "MONEY", "PERCENT", "LAW", "PERSON"]:
-                        keywords.append(ent.text.lower())
+                entities = self._doc_entities(self.nlp(chunk, disable=self._spacy_disabled_components()))
             except Exception:
-                pass
+                entities = None
+        for ent in entities or []:
+            if ent["label"] in self.KEYWORD_ENTITY_LABELS:
+                keywords.append(ent["text"].lower())
         
         # 去重并限制数量
         return list(set(keywords))[:10]
@@ -670,9 +899,8 @@ class UnifiedRAGService:
                 expansions.extend(risk_context[:3])
         
         # 监管相关扩展
-        for regulation in self.financial_keywords["regulations"]:
-            if regulation.lower() in query_lower:
-                expansions.append(f"{regulation} compliance")
+        for regulation in self.keyword_matcher.scan(query)["regulations"]:
+            expansions.append(f"{regulation} compliance")
         
         if expansions:
             return f"{query} ({' OR '.join(expansions)})"
@@ -725,11 +953,13 @@ class UnifiedRAGService:
             keyword_score = sum(1 for term in query_terms if term in content_lower) / len(query_terms)
             
             # 计算金融术语匹配分数
-            financial_score = 0
-            for category, terms in self.financial_keywords.items():
-                for term in terms:
-                    if term in content_lower and any(qt in term for qt in query_terms):
-                        financial_score += 1
+            keyword_hits = self.keyword_matcher.scan(doc.page_content)
+            financial_score = sum(
+                1
+                for category in self.financial_keywords
+                for term in keyword_hits[category]
+                if any(qt in term.lower() for qt in query_terms)
+            )
             
             # 综合分数
             total_score = keyword_score * 0.7 + min(financial_score / 10, 1.0) * 0.3
@@ -801,7 +1031,7 @@ class UnifiedRAGService:
         if len(documents) <= 3:
             return documents
         
-        compression_prompt = ChatPromptTemplate.from_template("""
+        compression_prompt = self.llm_registry.compile_template("""
         作为金融风险分析专家，请从以下文档片段中提取与查询最相关的关键信息。
         保持原文的重要细节，但去除冗余内容。
         
@@ -869,13 +1099,10 @@ class UnifiedRAGService:
         key_concepts = []
         
         for doc in docs[:3]:  # 只分析前3个文档
-            content_lower = doc.page_content.lower()
-            
             # 提取金融关键词
-            for category, terms in self.financial_keywords.items():
-                for term in terms:
-                    if term in content_lower:
-                        key_concepts.append(term)
+            keyword_hits = self.keyword_matcher.scan(doc.page_content)
+            for category in self.financial_keywords:
+                key_concepts.extend(keyword_hits[category])
         
         # 统计并返回最常见的概念
         concept_counts = Counter(key_concepts)
@@ -907,7 +1134,7 @@ class UnifiedRAGService:
         # 选择合适的提示词模板
         prompt_template = self._select_prompt_template(query_type, dominant_doc_type)
         
-        return ChatPromptTemplate.from_template(prompt_template)
+        return self.llm_registry.compile_template(prompt_template)
 
     def _classify_query_type(self, query: str) -> str:
         """分类查询类型"""
@@ -1103,7 +1330,7 @@ class UnifiedRAGService:
 
     async def _generate_explanation(self, query: str, answer: str, documents: List[Document]) -> str:
         """生成回答解释"""
-        explanation_prompt = ChatPromptTemplate.from_template("""
+        explanation_prompt = self.llm_registry.compile_template("""
 请为以下问答对生成一个简短的解释，说明答案的依据和推理过程：
 
 问题：{query}
@@ -1191,7 +1418,7 @@ class UnifiedRAGService:
 - 如信息不足，明确说明
 """
         
-        return ChatPromptTemplate.from_template(base_template + specific_instruction)
+        return self.llm_registry.compile_template(base_template + specific_instruction)
 
 
 # 测试函数
@@ -1,15 +1,15 @@
 # risk_analyzer.py
 import json
 import logging
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema.output_parser import StrOutputParser
 from ..utils.prompt_registry import PROMPT_REGISTRY, get_prompt_by_id
 from ..utils.rag_config import RAGConfig
+from ..utils.result_cache import AnalysisResultCache
+from .llm_registry import LLMRegistry, get_llm_registry
+from .llm_scheduler import LLMScheduler
 from dotenv import load_dotenv
 import os
 import asyncio
-from typing import List, Dict
+from typing import Any, Callable, List, Dict, Set, Tuple
 
 # 加载 .env 文件
 load_dotenv()
@@ -17,50 +17,349 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Keyword categories (see UnifiedRAGService._load_financial_keywords) that matter most per prompt
+PROMPT_FOCUS_CATEGORIES = {
+    "risk_classifier": ["risk_types", "risk_indicators"],
+    "compliance_audit_v2": ["regulations", "financial_statements"],
+    "esg_risk_v2": ["risk_indicators", "regulations"],
+    "financial_health_v3": ["financial_metrics", "financial_statements"],
+    "cybersecurity_risk_v2": ["risk_types", "regulations"],
+    "operational_resilience_v2": ["risk_types", "risk_indicators"],
+}
+DEFAULT_FOCUS_CATEGORIES = ["risk_types", "risk_indicators"]
+
+# Appended to a registry template in batched mode; {paragraph} then holds several [[Pn]] blocks
+BATCH_INSTRUCTION = """
+
+**Batch Mode:**
+The Paragraph input above contains {count} separate paragraphs, each wrapped in [[Pn]] ... [[/Pn]] markers.
+Analyze every paragraph independently using the instructions above.
+Respond with a JSON array of exactly {count} objects in the same order. Each object must follow the
+Output Format above and additionally include "paragraph_id": n (the number from its marker).
+Return only the JSON array."""
+
+
 class RiskAnalyzerService:
-    def __init__(self):
-        self.model = ChatOpenAI(
-            model=RAGConfig.LLM_MODEL,
-            api_key=os.getenv("OPENAI_API_KEY", RAGConfig.OPENAI_API_KEY)
-        )
-        self.output_parser = StrOutputParser()
+    def __init__(self, config: Dict = None, rag_service=None, llm_registry: LLMRegistry = None):
+        self.config = config or {}
+        # Compiled prompts/chains and pooled clients, shared with the RAG service
+        self.llm_registry = llm_registry or get_llm_registry(self.config)
+        self.llm_registry.compile_all(suffixes={"batch": BATCH_INSTRUCTION})
+        self.model = self.llm_registry.get_client(RAGConfig.LLM_MODEL)
+        # Used for cheap keyword-based paragraph pre-selection
+        self.rag_service = rag_service
+        # Caps concurrent LLM calls and enforces RPM/TPM budgets across all analyses
+        # (and the RAG service's chunk summaries, when it has a scheduler to share)
+        self.scheduler = getattr(rag_service, "scheduler", None) or LLMScheduler.from_config(self.config)
+        self.result_cache = None
+        if self.config.get("result_cache_enabled", RAGConfig.RESULT_CACHE_ENABLED):
+            self.result_cache = AnalysisResultCache(
+                db_path=self.config.get("result_cache_path", RAGConfig.RESULT_CACHE_PATH),
+                max_bytes=self.config.get("result_cache_max_mb", RAGConfig.RESULT_CACHE_MAX_MB) * 1024 * 1024
+            )
+
+    def select_paragraphs(self, paragraphs: List[Dict], prompt_key: str, max_paragraphs: int = None,
+                          scores: List[Dict] = None) -> Tuple[List[Dict], Dict]:
+        """Pick the top max_paragraphs paragraphs for a prompt by keyword relevance.
+
+        Selected paragraphs keep their original document order. Returns the
+        selection and a dict describing the criteria used.
+        """
+        criteria = {
+            "strategy": "all",
+            "max_paragraphs": max_paragraphs,
+            "total_paragraphs": len(paragraphs),
+            "selected_paragraphs": len(paragraphs)
+        }
+        if not max_paragraphs or len(paragraphs) <= max_paragraphs:
+            return paragraphs, criteria
+
+        if self.rag_service is None:
+            criteria.update({"strategy": "document_order", "selected_paragraphs": max_paragraphs})
+            return paragraphs[:max_paragraphs], criteria
+
+        scores = scores or self.score_paragraphs(paragraphs)
+        focus = PROMPT_FOCUS_CATEGORIES.get(prompt_key, DEFAULT_FOCUS_CATEGORIES)
+        ranked = []
+        for i, score in enumerate(scores):
+            focus_hits = sum(score["category_counts"].get(category, 0) for category in focus)
+            ranked.append((score["importance"] + min(focus_hits / 5, 1.0) * 0.5, i))
+        ranked.sort(key=lambda item: (-item[0], item[1]))
+        top = ranked[:max_paragraphs]
+        selected_indices = sorted(i for _, i in top)
+
+        criteria.update({
+            "strategy": "keyword_importance",
+            "focus_categories": focus,
+            "selected_paragraphs": len(selected_indices),
+            "min_selected_score": round(top[-1][0], 4),
+            "max_selected_score": round(top[0][0], 4)
+        })
+        return [paragraphs[i] for i in selected_indices], criteria
 
-    async def analyze_risks(self, paragraphs: List[Dict], prompts: List[str], model_name: str = None) -> Dict:
-        """Analyze risks in paragraphs using specified prompts."""
+    def score_paragraphs(self, paragraphs: List[Dict]) -> List[Dict]:
+        """Keyword category counts and importance score for each paragraph."""
+        scores = []
+        for para in paragraphs:
+            counts = self.rag_service.keyword_category_counts(para["text"])
+            scores.append({
+                "category_counts": counts,
+                "importance": self.rag_service.score_paragraph_importance(para["text"], counts)
+            })
+        return scores
+
+    async def analyze_risks(self, paragraphs: List[Dict], prompts: List[str], model_name: str = None,
+                            max_paragraphs: int = None, batch_size: int = None,
+                            progress_callback: Callable[[List[Dict], Dict], Any] = None,
+                            skip_pairs: Set[Tuple[str, int]] = None) -> Dict:
+        """Analyze risks in paragraphs using specified prompts.
+
+        When max_paragraphs is set, only the most relevant paragraphs are sent per prompt.
+        When batch_size > 1, that many paragraphs are packed into each LLM request.
+        progress_callback(new_results, progress) is called (sync or async) whenever a
+        group of paragraph analyses completes, with progress = {completed, failed, total}.
+        (prompt, paragraph_index) pairs in skip_pairs were already analysed by an earlier
+        run; they are not submitted again and count as completed.
+        """
         if not paragraphs or not prompts:
             logger.warning("Empty paragraphs or prompts provided")
             return {"results": []}
 
+        batch_size = batch_size if batch_size is not None else self.config.get("risk_batch_size", RAGConfig.RISK_BATCH_SIZE)
+        model_name = model_name or RAGConfig.LLM_MODEL
+        use_batches = bool(batch_size and batch_size > 1)
         try:
-            model = ChatOpenAI(
-                model=model_name or RAGConfig.LLM_MODEL,
-                api_key=os.getenv("OPENAI_API_KEY", RAGConfig.OPENAI_API_KEY)
-            )
-            results = []
             tasks = []
+            task_groups = []
+            selection = {}
+            scheduler_stats = self.scheduler.new_stats()
+            scheduler_stats.update({"batched_requests": 0, "batch_item_retries": 0})
+            cache_stats = {"enabled": self.result_cache is not None, "hits": 0, "misses": 0}
+            cached_outcomes = []
+            skipped = 0
+            valid_paragraphs = []
+            for para in paragraphs:
+                if not isinstance(para, dict) or "text" not in para:
+                    logger.error(f"Invalid paragraph format: {para}")
+                    continue
+                valid_paragraphs.append(para)
+            # Score once, rank per prompt
+            scores = None
+            if max_paragraphs and len(valid_paragraphs) > max_paragraphs and self.rag_service is not None:
+                scores = self.score_paragraphs(valid_paragraphs)
             for prompt_key in prompts:
-                prompt_config = get_prompt_by_id(prompt_key)  # 使用 get_prompt_by_id
+                prompt_config = self.llm_registry.get_prompt_config(prompt_key)
                 if not prompt_config:
                     logger.warning(f"Prompt {prompt_key} not found in registry")
                     continue
-                chain = ChatPromptTemplate.from_template(prompt_config.template) | model | self.output_parser
-                for para in paragraphs:
-                    if not isinstance(para, dict) or "text" not in para:
-                        logger.error(f"Invalid paragraph format: {para}")
-                        continue
-                    tasks.append(self._analyze_single_paragraph(chain, para, prompt_key))
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            return {"results": [r for r in results if not isinstance(r, Exception)]}
+                selected, selection[prompt_key] = self.select_paragraphs(
+                    valid_paragraphs, prompt_key, max_paragraphs, scores=scores
+                )
+                if skip_pairs:
+                    remaining = [para for para in selected if (prompt_key, para.get("paragraph_index")) not in skip_pairs]
+                    skipped += len(selected) - len(remaining)
+                    selected = remaining
+
+                # Serve previously analysed paragraphs from the result cache
+                cache_keys = {}
+                if self.result_cache is not None:
+                    cache_keys = {
+                        id(para): self.result_cache.make_key(prompt_key, prompt_config.version, model_name, para["text"])
+                        for para in selected
+                    }
+                    cached = await self.result_cache.get_many(list(set(cache_keys.values())))
+                    misses = []
+                    for para in selected:
+                        analysis = cached.get(cache_keys[id(para)])
+                        if analysis is None:
+                            misses.append(para)
+                        else:
+                            cached_outcomes.append((prompt_key, para, {
+                                "paragraph": para["text"], "paragraph_index": para.get("paragraph_index"),
+                                "analysis": analysis, "prompt": prompt_key, "cached": True
+                            }))
+                    cache_stats["hits"] += len(selected) - len(misses)
+                    cache_stats["misses"] += len(misses)
+                    selected = misses
+
+                group_size = batch_size if use_batches else 1
+                for start in range(0, len(selected), group_size):
+                    group = selected[start:start + group_size]
+                    task_groups.append(group)
+                    tasks.append(self._analyze_group(
+                        model_name, use_batches, group, prompt_key, prompt_config, scheduler_stats,
+                        cache_keys=[cache_keys[id(para)] for para in group] if cache_keys else None
+                    ))
+            progress = {
+                "completed": skipped,
+                "failed": 0,
+                "total": skipped + len(cached_outcomes) + sum(len(group) for group in task_groups)
+            }
+
+            async def report(group_outcomes):
+                if progress_callback is None:
+                    return
+                new_results = []
+                for _, _, result in group_outcomes:
+                    if isinstance(result, Exception):
+                        progress["failed"] += 1
+                    else:
+                        new_results.append(result)
+                progress["completed"] += len(group_outcomes)
+                callback_result = progress_callback(new_results, dict(progress))
+                if asyncio.iscoroutine(callback_result):
+                    await callback_result
+
+            async def tracked(task):
+                group_outcomes = await task
+                await report(group_outcomes)
+                return group_outcomes
+
+            if cached_outcomes:
+                await report(cached_outcomes)
+            outcomes = cached_outcomes + [
+                outcome for group in await asyncio.gather(*[tracked(task) for task in tasks]) for outcome in group
+            ]
+            results = [result for _, _, result in outcomes if not isinstance(result, Exception)]
+            failures = [
+                {
+                    "prompt": prompt_key,
+                    "paragraph_index": para.get("paragraph_index"),
+                    "error": repr(result)
+                }
+                for prompt_key, para, result in outcomes
+                if isinstance(result, Exception)
+            ]
+            if failures:
+                logger.warning(f"{len(failures)} of {len(outcomes)} paragraph analyses were dropped")
+            lookups = cache_stats["hits"] + cache_stats["misses"]
+            cache_stats["hit_rate"] = cache_stats["hits"] / lookups if lookups else None
+            return {
+                "results": results,
+                "paragraph_selection": selection,
+                "scheduler_stats": scheduler_stats,
+                "cache_stats": cache_stats,
+                "failures": failures
+            }
         except Exception as e:
             logger.error(f"Error analyzing risks: {str(e)}", exc_info=True)
             raise
 
-    async def _analyze_single_paragraph(self, chain, para: Dict, prompt_key: str) -> Dict:
-        """Analyze a single paragraph."""
+    async def _analyze_group(self, model_name: str, use_batches: bool, paras: List[Dict], prompt_key: str,
+                             prompt_config, stats: Dict, cache_keys: List[str] = None) -> List[Tuple[str, Dict, Any]]:
+        """Analyze a group of paragraphs; returns (prompt_key, paragraph, result or exception) per paragraph.
+
+        Groups of more than one paragraph go out as one batched request; items the
+        batch response does not cover or that fail to parse are retried individually.
+        Successfully parsed analyses are written to the result cache under cache_keys.
+        """
+        outcomes = await self._run_group(model_name, use_batches, paras, prompt_key, prompt_config, stats)
+        if cache_keys and self.result_cache is not None:
+            await self.result_cache.put_many({
+                key: result["analysis"]
+                for key, (_, _, result) in zip(cache_keys, outcomes)
+                if not isinstance(result, Exception) and "error" not in result["analysis"]
+            })
+        return outcomes
+
+    async def _run_group(self, model_name: str, use_batches: bool, paras: List[Dict], prompt_key: str,
+                         prompt_config, stats: Dict) -> List[Tuple[str, Dict, Any]]:
+        batch_results = [None] * len(paras)
+        if use_batches and len(paras) > 1:
+            try:
+                batch_chain = self.llm_registry.get_chain(
+                    prompt_key, model_name, variant="batch", suffix=BATCH_INSTRUCTION
+                )
+                batch_results = await self._analyze_paragraph_batch(batch_chain, paras, prompt_key, prompt_config, stats)
+            except Exception as e:
+                logger.warning(f"Batch of {len(paras)} paragraphs failed for {prompt_key}, retrying individually: {str(e)}")
+
+        pending = [i for i, result in enumerate(batch_results) if result is None]
+        if len(paras) > 1:
+            stats["batch_item_retries"] += len(pending)
+        retried = await asyncio.gather(*[
+            self._analyze_single_paragraph(
+                self.llm_registry.get_chain(prompt_key, model_name), paras[i], prompt_key,
+                prompt_config=prompt_config,
+                estimated_tokens=LLMScheduler.estimate_tokens(
+                    prompt_config.template, paras[i]["text"], completion_tokens=RAGConfig.MAX_TOKENS
+                ),
+                stats=stats
+            )
+            for i in pending
+        ], return_exceptions=True)
+        for i, result in zip(pending, retried):
+            batch_results[i] = result
+        return [(prompt_key, para, result) for para, result in zip(paras, batch_results)]
+
+    async def _analyze_paragraph_batch(self, batch_chain, paras: List[Dict], prompt_key: str,
+                                       prompt_config, stats: Dict) -> List[Dict]:
+        """Analyze several paragraphs in one request; None marks items that need a retry."""
+        packed = "\n\n".join(
+            f"[[P{i}]]\n{para['text']}\n[[/P{i}]]" for i, para in enumerate(paras, start=1)
+        )
+        raw_output = await self.scheduler.run(
+            lambda: batch_chain.ainvoke({"paragraph": packed, "count": len(paras)}),
+            estimated_tokens=LLMScheduler.estimate_tokens(
+                prompt_config.template, packed, completion_tokens=RAGConfig.MAX_TOKENS * len(paras)
+            ),
+            stats=stats
+        )
+        stats["batched_requests"] += 1
+
+        items = self._split_batch_output(raw_output, len(paras))
+        results = []
+        for para, item in zip(paras, items):
+            parsed = self._parse_output(json.dumps(item), prompt_config) if item is not None else None
+            if parsed is None or "error" in parsed:
+                results.append(None)
+            else:
+                results.append({
+                    "paragraph": para["text"], "paragraph_index": para.get("paragraph_index"),
+                    "analysis": parsed, "prompt": prompt_key
+                })
+        return results
+
+    def _split_batch_output(self, raw_output: str, count: int) -> List[Dict]:
+        """Split a JSON-array batch response into per-paragraph objects (None where missing)."""
+        items = [None] * count
         try:
-            raw_output = await chain.ainvoke({"paragraph": para["text"]})  # 使用 "paragraph" 作为键
-            parsed = self._parse_output(raw_output, get_prompt_by_id(prompt_key))
-            return {"paragraph": para["text"], "analysis": parsed, "prompt": prompt_key}
+            cleaned_output = "\n".join(line.strip() for line in raw_output.splitlines() if line.strip())
+            cleaned_output = cleaned_output.strip().strip("```json").strip("```")
+            parsed = json.loads(cleaned_output)
+        except json.JSONDecodeError as e:
+            logger.error(f"Batch JSON parsing failed: {str(e)}, raw_output: {raw_output[:100]}...")
+            return items
+        if not isinstance(parsed, list):
+            return items
+
+        for position, item in enumerate(parsed):
+            if not isinstance(item, dict):
+                continue
+            # Prefer the echoed paragraph_id, fall back to array position
+            paragraph_id = item.pop("paragraph_id", position + 1)
+            try:
+                index = int(paragraph_id) - 1
+            except (TypeError, ValueError):
+                index = position
+            if 0 <= index < count and items[index] is None:
+                items[index] = item
+        return items
+
+    async def _analyze_single_paragraph(self, chain, para: Dict, prompt_key: str, prompt_config=None,
+                                        estimated_tokens: int = 0, stats: Dict = None) -> Dict:
+        """Analyze a single paragraph through the rate-limited scheduler."""
+        try:
+            raw_output = await self.scheduler.run(
+                lambda: chain.ainvoke({"paragraph": para["text"]}),  # 使用 "paragraph" 作为键
+                estimated_tokens=estimated_tokens,
+                stats=stats
+            )
+            parsed = self._parse_output(raw_output, prompt_config or self.llm_registry.get_prompt_config(prompt_key))
+            return {
+                "paragraph": para["text"], "paragraph_index": para.get("paragraph_index"),
+                "analysis": parsed, "prompt": prompt_key
+            }
         except Exception as e:
             logger.error(f"Error analyzing paragraph: {str(e)}", exc_info=True)
             raise
@@ -73,7 +372,12 @@ class RiskAnalyzerService:
             cleaned_output = cleaned_output.strip().strip("```json").strip("```")
             parsed = json.loads(cleaned_output)
             expected_fields = prompt_config.expected_output_schema.keys()
-            return {field: parsed.get(field, "N/A") for field in expected_fields}
+            result = {field: parsed.get(field, "N/A") for field in expected_fields}
+            # Valid JSON without any expected field is as useless as unparseable output (and must not be cached)
+            if result and all(value == "N/A" for value in result.values()):
+                logger.error(f"LLM output has none of the expected fields, raw_output: {raw_output[:100]}...")
+                return {"error": "Parse_Error", "raw_output": raw_output[:500], **result}
+            return result
         except json.JSONDecodeError as e:
             logger.error(f"JSON parsing failed: {str(e)}, raw_output: {raw_output[:100]}...")
             return {
@@ -1,11 +1,12 @@
 # services/__init__.py
-from typing import Dict, List, Any, Optional
+from typing import Callable, Dict, List, Any, Optional, Set, Tuple
 from .pdf_processor import PDFProcessorService
 from .risk_analyzer import RiskAnalyzerService
 from .rag_service import AdvancedRAGService
 from .graph_service import GraphService
 from .export_service import ExportService
 from .visualization_service import VisualizationService
+from .llm_registry import LLMRegistry
 from ..utils.rag_config import RAGConfig
 from dotenv import load_dotenv
 import os
@@ -37,9 +38,12 @@ class FinRiskGPTServices:
 
         # Initialize services with configuration
         try:
-            self.pdf_processor = PDFProcessorService(config=self.config)
-            self.risk_analyzer = RiskAnalyzerService(config=self.config)
-            self.rag_service = AdvancedRAGService(config=self.config)
+            self.llm_registry = LLMRegistry(config=self.config)
+            self.rag_service = AdvancedRAGService(config=self.config, llm_registry=self.llm_registry)
+            self.pdf_processor = PDFProcessorService(config=self.config, rag_service=self.rag_service)
+            self.risk_analyzer = RiskAnalyzerService(
+                config=self.config, rag_service=self.rag_service, llm_registry=self.llm_registry
+            )
             self.graph_service = GraphService(config=self.config)
             self.export_service = ExportService(config=self.config)
             self.visualization_service = VisualizationService(config=self.config)
@@ -74,7 +78,7 @@ class FinRiskGPTServices:
             metadata (Dict[str, Any]): Metadata associated with the document.
 
         Returns:
-            Dict[str, Any]: Processed document data.
+            Dict[str, Any]: Processed document data (paragraphs_count and storage_path; paragraphs stay on disk).
 
         Raises:
             ValueError: If file path or metadata is invalid.
@@ -92,13 +96,17 @@ class FinRiskGPTServices:
             logger.error(f"Failed to process document {document_id}: {str(e)}", exc_info=True)
             raise
 
-    async def analyze_risks(self, paragraphs: List[Dict[str, Any]], prompts: List[str], model_name: str = None) -> Dict[str, Any]:
+    async def analyze_risks(self, paragraphs: List[Dict[str, Any]], prompts: List[str], model_name: str = None, max_paragraphs: Optional[int] = None, batch_size: Optional[int] = None, progress_callback: Optional[Callable] = None, skip_pairs: Optional[Set[Tuple[str, int]]] = None) -> Dict[str, Any]:
         """Analyze risks in paragraphs using specified prompts.
 
         Args:
             paragraphs (List[Dict[str, Any]]): List of paragraph dictionaries with 'text' key.
             prompts (List[str]): List of prompt keys from PROMPT_REGISTRY.
             model_name (str, optional): Specific model to use. Defaults to None.
+            max_paragraphs (int, optional): Most relevant paragraphs to analyze per prompt. Defaults to all.
+            batch_size (int, optional): Paragraphs packed per LLM request. Defaults to RAGConfig.RISK_BATCH_SIZE.
+            progress_callback (Callable, optional): Called with (new_results, progress) as analyses complete.
+            skip_pairs (Set[Tuple[str, int]], optional): (prompt, paragraph_index) pairs already analysed; not resubmitted.
 
         Returns:
             Dict[str, Any]: Analysis results.
@@ -114,7 +122,7 @@ class FinRiskGPTServices:
             logger.error("Empty prompts provided")
             raise ValueError("Prompts list cannot be empty")
         try:
-            return await self.risk_analyzer.analyze_risks(paragraphs, prompts, model_name=model_name)
+            return await self.risk_analyzer.analyze_risks(paragraphs, prompts, model_name=model_name, max_paragraphs=max_paragraphs, batch_size=batch_size, progress_callback=progress_callback, skip_pairs=skip_pairs)
         except Exception as e:
             logger.error(f"Failed to analyze risks: {str(e)}", exc_info=True)
             raise
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Modules import each other as top-level packages (utils, services), as when run from app/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,77 @@
+import asyncio
+
+from utils.database import DatabaseManager
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_custom_prompt_leaves_dashboard_unchanged(tmp_path):
+    async def scenario():
+        db = DatabaseManager(str(tmp_path / "test.db"), readers=1)
+        await db.connect()
+        try:
+            await db.store_document_metadata("doc-1", "user-1", filename="10k.pdf")
+            await db.store_analysis_results(
+                "doc-1", "user-1",
+                {"results": [{"paragraph": "p", "prompt": "risk", "analysis": {"risk_type_1": "Credit Risk"}}]},
+                ["risk"]
+            )
+            before = await db.get_user_analytics("user-1")
+            trends_before = await db.get_risk_trends("user-1")
+
+            await db.store_custom_prompt("my-prompt", "user-1", {"id": "my-prompt", "template": "Assess {paragraph}"})
+            await db.store_custom_prompt("my-prompt", "user-1", {"id": "my-prompt", "template": "Rate {paragraph}"})
+
+            return before, trends_before, await db.get_user_analytics("user-1"), await db.get_risk_trends("user-1")
+        finally:
+            await db.close()
+
+    before, trends_before, after, trends_after = run(scenario())
+    assert after == before
+    assert trends_after == trends_before
+    assert after["analysis_count"] == 1
+
+
+def test_storage_document_is_resolved_only_for_its_owner(tmp_path):
+    async def scenario():
+        db = DatabaseManager(str(tmp_path / "test.db"), readers=1)
+        await db.connect()
+        try:
+            await db.store_document_metadata("doc-1", "user-1", filename="10k.pdf", content_hash="h")
+            await db.store_document_metadata("doc-2", "user-2", filename="copy.pdf", content_hash="h",
+                                             canonical_document_id="doc-1")
+            return [
+                await db.resolve_storage_document_id("doc-1", "user-1"),
+                await db.resolve_storage_document_id("doc-2", "user-2"),
+                await db.resolve_storage_document_id("doc-1", "user-2"),
+                await db.resolve_storage_document_id("missing", "user-1"),
+            ]
+        finally:
+            await db.close()
+
+    assert run(scenario()) == ["doc-1", "doc-1", None, None]
+
+
+def test_reprocessed_upload_takes_over_a_stale_content_hash(tmp_path):
+    async def scenario():
+        db = DatabaseManager(str(tmp_path / "test.db"), readers=1)
+        await db.connect()
+        try:
+            await db.store_document_metadata("doc-1", "user-1", filename="10k.pdf", content_hash="h")
+            await db.store_document_metadata("doc-2", "user-2", filename="copy.pdf", content_hash="h",
+                                             canonical_document_id="doc-1")
+            # doc-1's artefacts were lost, so the next identical upload was processed again
+            await db.store_document_metadata("doc-3", "user-3", filename="again.pdf", content_hash="h")
+            return (
+                await db.find_document_by_hash("h"),
+                await db.resolve_storage_document_id("doc-1", "user-1"),
+                await db.resolve_storage_document_id("doc-2", "user-2"),
+            )
+        finally:
+            await db.close()
+
+    existing, doc_1, doc_2 = run(scenario())
+    assert existing["document_id"] == "doc-3"
+    assert doc_1 == doc_2 == "doc-3"
@@ -1,3 +1,4 @@
+import os
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -9,4 +10,21 @@ class Config:
     TEMPLATE_PATH = "templates"
     CHUNK_SIZE = 800
     CHUNK_OVERLAP = 150
-    DEFAULT_MODEL = "gpt-4o"
\ No newline at end of file
+    DEFAULT_MODEL = "gpt-4o"
+    UPLOAD_TMP_DIR = None  # None -> system temp dir
+    UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1 MB per read
+    MAX_UPLOAD_SIZE_MB = int(os.getenv("MAX_UPLOAD_SIZE_MB", "200"))  # large 10-K filings with exhibits exceed 50 MB
+    JOB_BACKEND_URL = os.getenv("JOB_BACKEND_URL", "sqlite:///finriskgpt_jobs.db")
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))  # concurrent jobs per process
+    JOB_WORKERS_IN_API = os.getenv("JOB_WORKERS_IN_API", "true").lower() == "true"  # false -> run app/worker.py separately
+    JOB_POLL_INTERVAL = 1.0  # seconds between claims when the queue is empty
+    JOB_LEASE_SECONDS = 60.0
+    JOB_HEARTBEAT_SECONDS = 15.0
+    JOB_TTL_HOURS = 24  # finished jobs and their partial results are removed after this
+    DB_READER_CONNECTIONS = int(os.getenv("DB_READER_CONNECTIONS", "4"))  # plus one writer connection
+    DB_STATEMENT_CACHE_SIZE = 256  # compiled statements kept per connection
+    DASHBOARD_CACHE_SIZE = 1024  # users
+    DASHBOARD_CACHE_TTL_SECONDS = 30.0
+    DASHBOARD_RECENT_ANALYSES = 10
+    DB_WRITE_BATCH_SIZE = 200  # writes grouped into one transaction
+    DB_WRITE_BATCH_DELAY_MS = 20  # max wait for more writes before committing
@@ -3,7 +3,6 @@
 import asyncio
 import json
 import sqlite3
-import aiosqlite
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
 import hashlib
@@ -13,77 +12,351 @@ import os
 
 from dotenv import load_dotenv
 
+from .config import Config
+from .cache import LRUCache
+from .db_pool import SQLiteConnectionPool
+from .findings import FINDING_COLUMNS, extract_finding
+from .write_queue import WriteBehindQueue
+
 load_dotenv()
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Severity bucket shared by trend aggregates: numeric scores use the 10-point scale, labels are normalised
+SEVERITY_BUCKET_SQL = """
+    CASE
+        WHEN severity_score >= 8 OR lower(severity) = 'critical' THEN 'critical'
+        WHEN severity_score >= 6 OR lower(severity) = 'high' THEN 'high'
+        WHEN severity_score >= 4 OR lower(severity) = 'medium' THEN 'medium'
+        WHEN severity_score IS NOT NULL OR lower(severity) = 'low' THEN 'low'
+        ELSE 'unknown'
+    END
+"""
+UPSERT_TRENDS = f"""
+    INSERT INTO risk_trend_daily (user_id, day, risk_type, severity_bucket, count)
+    SELECT user_id, date(created_at), COALESCE(risk_type, 'Unknown'), {SEVERITY_BUCKET_SQL}, COUNT(*)
+    FROM analysis_findings
+"""
+GROUP_TRENDS = """
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (user_id, day, risk_type, severity_bucket) DO UPDATE SET count = count + excluded.count
+"""
+# Findings whose LLM output failed to parse are kept but never counted as risks
+UPDATE_TRENDS_FOR_ANALYSIS = f"{UPSERT_TRENDS} WHERE analysis_id = ? AND parse_error = 0 {GROUP_TRENDS}"
+SEVERITY_HISTOGRAM_FOR_ANALYSIS = (
+    f"SELECT {SEVERITY_BUCKET_SQL}, COUNT(*) FROM analysis_findings WHERE analysis_id = ? AND parse_error = 0 GROUP BY 1"
+)
+RISK_TYPES_FOR_ANALYSIS = """
+    SELECT COALESCE(risk_type, 'Unknown'), COUNT(*) FROM analysis_findings
+    WHERE analysis_id = ? AND parse_error = 0 GROUP BY 1
+"""
+
+# Rebuilds every user's dashboard row from the base tables and trend aggregates ({valid_findings} filters findings)
+DASHBOARD_BACKFILL = """
+        INSERT OR REPLACE INTO user_dashboard
+            (user_id, document_count, analysis_count, finding_count, severity_histogram, risk_type_counts, recent_analyses)
+        SELECT
+            u.user_id,
+            (SELECT COUNT(*) FROM documents WHERE user_id = u.user_id),
+            (SELECT COUNT(*) FROM analysis_results WHERE user_id = u.user_id),
+            (SELECT COUNT(*) FROM analysis_findings WHERE user_id = u.user_id {valid_findings}),
+            (SELECT COALESCE(json_group_object(severity_bucket, total), '{{}}') FROM (
+                SELECT severity_bucket, SUM(count) AS total FROM risk_trend_daily
+                WHERE user_id = u.user_id GROUP BY severity_bucket)),
+            (SELECT COALESCE(json_group_object(risk_type, total), '{{}}') FROM (
+                SELECT risk_type, SUM(count) AS total FROM risk_trend_daily
+                WHERE user_id = u.user_id GROUP BY risk_type)),
+            (SELECT COALESCE(json_group_array(json_object(
+                'analysis_id', r.id, 'document_id', r.document_id, 'prompts', json(r.prompts_used),
+                'findings', (SELECT COUNT(*) FROM analysis_findings WHERE analysis_id = r.id {valid_findings}),
+                'filename', d.filename, 'created_at', r.created_at)), '[]') FROM (
+                SELECT id, document_id, prompts_used, created_at FROM analysis_results
+                WHERE user_id = u.user_id ORDER BY created_at DESC LIMIT 10) AS r
+                LEFT JOIN documents AS d ON d.id = r.document_id)
+        FROM (
+            SELECT user_id FROM documents WHERE user_id IS NOT NULL
+            UNION SELECT user_id FROM analysis_results WHERE user_id IS NOT NULL
+        ) AS u
+        """
+
+# Schema migrations, applied in order; PRAGMA user_version records the last applied version
+MIGRATIONS = [
+    (1, "base schema", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id TEXT PRIMARY KEY,
+            username TEXT UNIQUE NOT NULL,
+            hashed_password TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS documents (
+            id TEXT PRIMARY KEY,
+            user_id TEXT,
+            filename TEXT NOT NULL,
+            document_type TEXT,
+            company TEXT,
+            filing_date TEXT,
+            paragraphs_count INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS document_hashes (
+            content_hash TEXT PRIMARY KEY,
+            document_id TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (document_id) REFERENCES documents(id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS analysis_results (
+            id TEXT PRIMARY KEY,
+            document_id TEXT,
+            user_id TEXT,
+            results TEXT,
+            prompts_used TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (document_id) REFERENCES documents(id),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+        """,
+    ]),
+    (2, "indexes for per-user and per-document lookups", [
+        "CREATE INDEX IF NOT EXISTS idx_documents_user_created ON documents(user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_document_hashes_document ON document_hashes(document_id)",
+        "CREATE INDEX IF NOT EXISTS idx_analysis_results_document_user ON analysis_results(document_id, user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_analysis_results_user_created ON analysis_results(user_id, created_at)",
+    ]),
+    (3, "normalised per-finding analysis storage", [
+        """
+        CREATE TABLE IF NOT EXISTS analysis_findings (
+            id INTEGER PRIMARY KEY,
+            analysis_id TEXT NOT NULL,
+            document_id TEXT,
+            user_id TEXT,
+            prompt TEXT,
+            paragraph_index INTEGER,
+            paragraph TEXT,
+            risk_type TEXT,
+            specific_risk TEXT,
+            severity TEXT,
+            severity_score REAL,
+            velocity_score REAL,
+            composite_score REAL,
+            confidence REAL,
+            analysis TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (analysis_id) REFERENCES analysis_results(id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_analysis_findings_analysis ON analysis_findings(analysis_id, prompt)",
+        "CREATE INDEX IF NOT EXISTS idx_analysis_findings_user_created ON analysis_findings(user_id, created_at)",
+    ]),
+    (4, "daily risk trend aggregates", [
+        """
+        CREATE TABLE IF NOT EXISTS risk_trend_daily (
+            user_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            risk_type TEXT NOT NULL,
+            severity_bucket TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, day, risk_type, severity_bucket)
+        ) WITHOUT ROWID
+        """,
+        # Backfill from findings stored so far
+        f"{UPSERT_TRENDS} WHERE true {GROUP_TRENDS}",
+    ]),
+    (5, "materialised per-user dashboard", [
+        """
+        CREATE TABLE IF NOT EXISTS user_dashboard (
+            user_id TEXT PRIMARY KEY,
+            document_count INTEGER NOT NULL DEFAULT 0,
+            analysis_count INTEGER NOT NULL DEFAULT 0,
+            finding_count INTEGER NOT NULL DEFAULT 0,
+            severity_histogram TEXT NOT NULL DEFAULT '{}',
+            risk_type_counts TEXT NOT NULL DEFAULT '{}',
+            recent_analyses TEXT NOT NULL DEFAULT '[]',
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Backfill from existing documents, analyses and trend aggregates
+        DASHBOARD_BACKFILL.format(valid_findings=""),
+    ]),
+    (6, "flag unparseable findings and drop them from aggregates", [
+        "ALTER TABLE analysis_findings ADD COLUMN parse_error INTEGER NOT NULL DEFAULT 0",
+        "UPDATE analysis_findings SET parse_error = 1 WHERE json_extract(analysis, '$.error') IS NOT NULL",
+        "DELETE FROM risk_trend_daily",
+        f"{UPSERT_TRENDS} WHERE parse_error = 0 {GROUP_TRENDS}",
+        DASHBOARD_BACKFILL.format(valid_findings="AND parse_error = 0"),
+    ]),
+    (7, "deduplicated uploads point at the document that holds their artefacts", [
+        "ALTER TABLE documents ADD COLUMN canonical_document_id TEXT",
+    ]),
+    (8, "custom prompt templates stored apart from analyses", [
+        """
+        CREATE TABLE IF NOT EXISTS custom_prompts (
+            user_id TEXT NOT NULL,
+            prompt_id TEXT NOT NULL,
+            template TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, prompt_id),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        ) WITHOUT ROWID
+        """,
+        # Prompts used to be saved as analysis_results rows; move them out and rebuild the dashboards
+        """
+        INSERT OR REPLACE INTO custom_prompts (user_id, prompt_id, template, created_at, updated_at)
+        SELECT user_id, substr(document_id, length('custom_prompt_') + 1), json_extract(results, '$.prompt'),
+               created_at, created_at
+        FROM analysis_results
+        WHERE document_id LIKE 'custom\\_prompt\\_%' ESCAPE '\\' AND user_id IS NOT NULL
+        ORDER BY created_at
+        """,
+        "DELETE FROM analysis_results WHERE document_id LIKE 'custom\\_prompt\\_%' ESCAPE '\\'",
+        "DELETE FROM user_dashboard",
+        DASHBOARD_BACKFILL.format(valid_findings="AND parse_error = 0"),
+    ]),
+]
+
+TREND_TIMEFRAMES = {"7d": 7, "30d": 30, "90d": 90, "1y": 365}
+
+# Hot queries whose plans are checked at startup; each must be served by an index
+SELECT_LATEST_ANALYSIS = """
+    SELECT id, results FROM analysis_results
+    WHERE document_id = ? AND user_id = ?
+    ORDER BY created_at DESC, rowid DESC LIMIT 1
+"""
+INSERT_FINDING = (
+    f"INSERT INTO analysis_findings (analysis_id, document_id, user_id, {', '.join(FINDING_COLUMNS)}) "
+    f"VALUES (?, ?, ?, {', '.join('?' * len(FINDING_COLUMNS))})"
+)
+SELECT_FINDINGS = "SELECT {columns} FROM analysis_findings WHERE analysis_id = ? ORDER BY id"
+SELECT_PROMPT_FINDINGS = "SELECT {columns} FROM analysis_findings WHERE analysis_id = ? AND prompt = ? ORDER BY id"
+SELECT_USER_DASHBOARD = """
+    SELECT document_count, analysis_count, finding_count, severity_histogram, risk_type_counts,
+           recent_analyses, updated_at
+    FROM user_dashboard WHERE user_id = ?
+"""
+SELECT_RISK_TRENDS = """
+    SELECT day, risk_type, severity_bucket, count FROM risk_trend_daily
+    WHERE user_id = ? AND day >= ?
+    ORDER BY day
+"""
+HOT_QUERIES = {
+    "latest_analysis": (SELECT_LATEST_ANALYSIS, ("", "")),
+    "user_dashboard": (SELECT_USER_DASHBOARD, ("",)),
+    "risk_trends": (SELECT_RISK_TRENDS, ("", "")),
+    "analysis_findings": (SELECT_PROMPT_FINDINGS.format(columns="risk_type, severity"), ("", "")),
+}
+
+def _log_write_failure(future: "asyncio.Future"):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Queued database write failed: {repr(future.exception())}")
+
 class DatabaseManager:
-    def __init__(self, db_path: str = "finriskgpt.db"):
+    def __init__(self, db_path: str = "finriskgpt.db", readers: int = None):
         self.db_path = db_path
-        asyncio.create_task(self.initialize_database())
+        self.dashboard_cache = LRUCache(maxsize=Config.DASHBOARD_CACHE_SIZE, ttl=Config.DASHBOARD_CACHE_TTL_SECONDS)
+        self.pool = SQLiteConnectionPool(
+            db_path,
+            readers=readers or Config.DB_READER_CONNECTIONS,
+            cached_statements=Config.DB_STATEMENT_CACHE_SIZE
+        )
+        self.write_queue = WriteBehindQueue(
+            self.pool, max_batch=Config.DB_WRITE_BATCH_SIZE, max_delay=Config.DB_WRITE_BATCH_DELAY_MS / 1000
+        )
+
+    async def connect(self):
+        """Open the connection pool and create the schema (call once at startup)"""
+        await self.pool.open()
+        await self.initialize_database()
+
+    async def close(self):
+        """Flush queued writes and close all connections"""
+        await self.write_queue.stop()
+        await self.pool.close()
+
+    async def _write(self, op, wait: bool = True, user_id: str = None):
+        """Queue a write for the next grouped transaction.
+
+        With wait=True, returns op's result once it has committed; otherwise returns
+        the acknowledgement future immediately (failures are logged).
+        """
+        future = await self.write_queue.submit(op)
+        if user_id is not None:
+            future.add_done_callback(lambda _: self.dashboard_cache.invalidate(lambda key: key == user_id))
+        if wait:
+            return await future
+        future.add_done_callback(_log_write_failure)
+        return future
 
     async def initialize_database(self):
-        """Initialize database schema"""
-        async with aiosqlite.connect(self.db_path) as db:
+        """Bring the schema up to date and check that hot queries use indexes"""
+        await self.migrate()
+        await self.check_query_plans()
+
+    async def migrate(self) -> int:
+        """Apply pending migrations; returns the resulting schema version"""
+        async with self.pool.writer() as db:
             try:
-                await db.execute("""
-                    CREATE TABLE IF NOT EXISTS users (
-                        id TEXT PRIMARY KEY,
-                        username TEXT UNIQUE NOT NULL,
-                        hashed_password TEXT NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                await db.execute("""
-                    CREATE TABLE IF NOT EXISTS documents (
-                        id TEXT PRIMARY KEY,
-                        user_id TEXT,
-                        filename TEXT NOT NULL,
-                        document_type TEXT,
-                        company TEXT,
-                        filing_date TEXT,
-                        paragraphs_count INTEGER,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users(id)
-                    )
-                """)
-                await db.execute("""
-                    CREATE TABLE IF NOT EXISTS analysis_results (
-                        id TEXT PRIMARY KEY,
-                        document_id TEXT,
-                        user_id TEXT,
-                        results TEXT,
-                        prompts_used TEXT,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (document_id) REFERENCES documents(id),
-                        FOREIGN KEY (user_id) REFERENCES users(id)
-                    )
-                """)
-                await db.commit()
+                cursor = await db.execute("PRAGMA user_version")
+                current = (await cursor.fetchone())[0]
+                for version, description, statements in MIGRATIONS:
+                    if version <= current:
+                        continue
+                    logger.info(f"Applying database migration {version}: {description}")
+                    await db.execute("BEGIN")
+                    for statement in statements:
+                        await db.execute(statement)
+                    await db.execute(f"PRAGMA user_version = {version}")
+                    await db.commit()
+                    current = version
+                # Refresh planner statistics so new indexes are picked up
+                await db.execute("PRAGMA optimize")
+                return current
             except Exception as e:
-                logger.error(f"Database initialization failed: {repr(e)}")
+                logger.error(f"Database migration failed: {repr(e)}")
                 raise
 
+    async def check_query_plans(self) -> Dict[str, List[str]]:
+        """Run EXPLAIN QUERY PLAN on HOT_QUERIES and warn about any full table scan"""
+        plans = {}
+        # The writer ran the migrations; EXPLAIN on a reader opened earlier may see the old schema
+        async with self.pool.writer() as db:
+            for name, (sql, params) in HOT_QUERIES.items():
+                cursor = await db.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+                plans[name] = [row[3] for row in await cursor.fetchall()]
+                scans = [step for step in plans[name] if step.startswith("SCAN") and "INDEX" not in step]
+                if scans:
+                    logger.warning(f"Query '{name}' falls back to a table scan: {'; '.join(scans)}")
+        return plans
+
     async def create_user(self, username: str, hashed_password: str) -> str:
         """Create a new user and return user ID"""
         user_id = hashlib.sha256(username.encode()).hexdigest()[:16]
-        async with aiosqlite.connect(self.db_path) as db:
-            try:
-                await db.execute(
-                    "INSERT INTO users (id, username, hashed_password) VALUES (?, ?, ?)",
-                    (user_id, username, hashed_password)
-                )
-                await db.commit()
-            except Exception as e:
-                logger.error(f"Failed to create user {username}: {repr(e)}")
-                raise
+
+        async def op(db):
+            await db.execute(
+                "INSERT INTO users (id, username, hashed_password) VALUES (?, ?, ?)",
+                (user_id, username, hashed_password)
+            )
+
+        try:
+            await self._write(op)
+        except Exception as e:
+            logger.error(f"Failed to create user {username}: {repr(e)}")
+            raise
         return user_id
 
     async def get_user(self, username: str) -> Optional[Dict[str, Any]]:
         """Get user by username"""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self.pool.reader() as db:
             try:
                 cursor = await db.execute(
                     "SELECT id, hashed_password FROM users WHERE username = ?", (username,)
@@ -94,71 +367,307 @@ class DatabaseManager:
                 logger.error(f"Failed to get user {username}: {repr(e)}")
                 raise
 
-    async def store_document_metadata(self, document_id: str, user_id: str, **kwargs):
+    async def store_document_metadata(self, document_id: str, user_id: str, wait: bool = True, **kwargs):
         """Store document metadata"""
-        async with aiosqlite.connect(self.db_path) as db:
-            try:
+        async def op(db):
+            await db.execute(
+                "INSERT INTO documents (id, user_id, filename, document_type, company, filing_date, paragraphs_count, canonical_document_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    document_id,
+                    user_id,
+                    kwargs.get("filename", ""),
+                    kwargs.get("document_type", ""),
+                    kwargs.get("company", ""),
+                    kwargs.get("filing_date", ""),
+                    kwargs.get("paragraphs_count", 0),
+                    kwargs.get("canonical_document_id")
+                )
+            )
+            # Index by content hash. A processed upload (no canonical_document_id) takes the hash over:
+            # it is either the first with this content or replaces a canonical document whose artefacts
+            # are gone, in which case that document and its aliases are repointed at the new one.
+            if kwargs.get("content_hash") and not kwargs.get("canonical_document_id"):
+                cursor = await db.execute(
+                    "SELECT document_id FROM document_hashes WHERE content_hash = ?", (kwargs["content_hash"],)
+                )
+                previous = await cursor.fetchone()
                 await db.execute(
-                    "INSERT INTO documents (id, user_id, filename, document_type, company, filing_date, paragraphs_count) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                    (
-                        document_id,
-                        user_id,
-                        kwargs.get("filename", ""),
-                        kwargs.get("document_type", ""),
-                        kwargs.get("company", ""),
-                        kwargs.get("filing_date", ""),
-                        kwargs.get("paragraphs_count", 0)
+                    """
+                    INSERT INTO document_hashes (content_hash, document_id) VALUES (?, ?)
+                    ON CONFLICT (content_hash) DO UPDATE SET
+                        document_id = excluded.document_id, created_at = CURRENT_TIMESTAMP
+                    """,
+                    (kwargs["content_hash"], document_id)
+                )
+                if previous and previous[0] != document_id:
+                    await db.execute(
+                        "UPDATE documents SET canonical_document_id = ? WHERE id = ? OR canonical_document_id = ?",
+                        (document_id, previous[0], previous[0])
                     )
+            await self._update_dashboard(db, user_id, documents_added=1)
+
+        try:
+            await self._write(op, wait=wait, user_id=user_id)
+        except Exception as e:
+            logger.error(f"Failed to store document metadata for {document_id}: {repr(e)}")
+            raise
+
+    async def find_document_by_hash(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Get the canonical document for a content hash, if one was already processed"""
+        async with self.pool.reader() as db:
+            try:
+                cursor = await db.execute(
+                    """
+                    SELECT COALESCE(d.canonical_document_id, d.id), d.paragraphs_count
+                    FROM document_hashes h JOIN documents d ON d.id = h.document_id
+                    WHERE h.content_hash = ?
+                    """,
+                    (content_hash,)
                 )
-                await db.commit()
+                result = await cursor.fetchone()
+                return {"document_id": result[0], "paragraphs_count": result[1]} if result else None
             except Exception as e:
-                logger.error(f"Failed to store document metadata for {document_id}: {repr(e)}")
+                logger.error(f"Failed to look up content hash {content_hash}: {repr(e)}")
                 raise
 
-    async def store_analysis_results(self, document_id: str, user_id: str, results: Dict, prompts_used: List[str]):
-        """Store analysis results"""
-        async with aiosqlite.connect(self.db_path) as db:
+    async def resolve_storage_document_id(self, document_id: str, user_id: str) -> Optional[str]:
+        """Get the id whose paragraph store and vectorstore hold a user's document; None if the user does not own it"""
+        async with self.pool.reader() as db:
             try:
-                await db.execute(
-                    "INSERT INTO analysis_results (id, document_id, user_id, results, prompts_used) VALUES (?, ?, ?, ?, ?)",
-                    (
-                        str(uuid.uuid4()),
-                        document_id,
-                        user_id,
-                        json.dumps(results),
-                        json.dumps(prompts_used)
-                    )
+                cursor = await db.execute(
+                    "SELECT COALESCE(canonical_document_id, id) FROM documents WHERE id = ? AND user_id = ?",
+                    (document_id, user_id)
                 )
-                await db.commit()
+                result = await cursor.fetchone()
+                return result[0] if result else None
             except Exception as e:
-                logger.error(f"Failed to store analysis results for {document_id}: {repr(e)}")
+                logger.error(f"Failed to resolve storage document for {document_id}: {repr(e)}")
                 raise
 
+    async def store_custom_prompt(self, prompt_id: str, user_id: str, template: Dict, wait: bool = True):
+        """Store (or replace) a user's custom prompt template; analyses, trends and the dashboard are untouched"""
+        async def op(db):
+            await db.execute(
+                """
+                INSERT INTO custom_prompts (user_id, prompt_id, template) VALUES (?, ?, ?)
+                ON CONFLICT (user_id, prompt_id) DO UPDATE SET
+                    template = excluded.template, updated_at = CURRENT_TIMESTAMP
+                """,
+                (user_id, prompt_id, json.dumps(template))
+            )
+
+        try:
+            return await self._write(op, wait=wait)
+        except Exception as e:
+            logger.error(f"Failed to store custom prompt {prompt_id}: {repr(e)}")
+            raise
+
+    async def store_analysis_results(self, document_id: str, user_id: str, results: Dict, prompts_used: List[str],
+                                     wait: bool = True) -> str:
+        """Store analysis results: run-level metadata plus one analysis_findings row per paragraph x prompt"""
+        analysis_id = str(uuid.uuid4())
+        findings = [extract_finding(result) for result in results.get("results", [])]
+        summary = {key: value for key, value in results.items() if key != "results"}
+
+        async def op(db):
+            await db.execute(
+                "INSERT INTO analysis_results (id, document_id, user_id, results, prompts_used) VALUES (?, ?, ?, ?, ?)",
+                (
+                    analysis_id,
+                    document_id,
+                    user_id,
+                    json.dumps(summary),
+                    json.dumps(prompts_used)
+                )
+            )
+            await db.executemany(
+                INSERT_FINDING,
+                [
+                    (
+                        analysis_id, document_id, user_id,
+                        *(json.dumps(finding[column]) if column == "analysis" else finding[column]
+                          for column in FINDING_COLUMNS)
+                    )
+                    for finding in findings
+                ]
+            )
+            await db.execute(UPDATE_TRENDS_FOR_ANALYSIS, (analysis_id,))
+            await self._update_dashboard(db, user_id, analysis={
+                "analysis_id": analysis_id,
+                "document_id": document_id,
+                "prompts": prompts_used,
+                "findings": sum(1 for finding in findings if not finding["parse_error"])
+            })
+
+        try:
+            await self._write(op, wait=wait, user_id=user_id)
+        except Exception as e:
+            logger.error(f"Failed to store analysis results for {document_id}: {repr(e)}")
+            raise
+        return analysis_id
+
     async def get_analysis_results(self, document_id: str, user_id: str) -> Optional[Dict]:
-        """Get analysis results by document ID and user ID"""
-        async with aiosqlite.connect(self.db_path) as db:
+        """Get the latest analysis results by document ID and user ID"""
+        async with self.pool.reader() as db:
             try:
-                cursor = await db.execute(
-                    "SELECT results FROM analysis_results WHERE document_id = ? AND user_id = ?",
-                    (document_id, user_id)
-                )
+                cursor = await db.execute(SELECT_LATEST_ANALYSIS, (document_id, user_id))
                 result = await cursor.fetchone()
-                return json.loads(result[0]) if result else None
+                if not result:
+                    return None
+                analysis_id, summary = result[0], json.loads(result[1])
+                # Runs stored before analysis_findings existed keep their results inline
+                if "results" not in summary:
+                    cursor = await db.execute(
+                        SELECT_FINDINGS.format(columns="paragraph, paragraph_index, analysis, prompt"), (analysis_id,)
+                    )
+                    summary["results"] = [
+                        {"paragraph": row[0], "paragraph_index": row[1], "analysis": json.loads(row[2]), "prompt": row[3]}
+                        for row in await cursor.fetchall()
+                    ]
+                return summary
             except Exception as e:
                 logger.error(f"Failed to get analysis results for {document_id}: {repr(e)}")
                 raise
 
+    async def get_findings(self, document_id: str, user_id: str, columns: List[str] = None,
+                           prompt: str = None) -> List[Dict[str, Any]]:
+        """Selected typed columns of the latest run's findings (avoids decoding whole analyses)"""
+        columns = columns or [column for column in FINDING_COLUMNS if column != "analysis"]
+        unknown = set(columns) - set(FINDING_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown finding columns: {sorted(unknown)}")
+        async with self.pool.reader() as db:
+            try:
+                cursor = await db.execute(SELECT_LATEST_ANALYSIS, (document_id, user_id))
+                result = await cursor.fetchone()
+                if not result:
+                    return []
+                analysis_id = result[0]
+                if prompt is None:
+                    cursor = await db.execute(SELECT_FINDINGS.format(columns=", ".join(columns)), (analysis_id,))
+                else:
+                    cursor = await db.execute(
+                        SELECT_PROMPT_FINDINGS.format(columns=", ".join(columns)), (analysis_id, prompt)
+                    )
+                rows = await cursor.fetchall()
+                if not rows:
+                    legacy = json.loads(result[1]).get("results")
+                    if legacy:
+                        findings = [extract_finding(item) for item in legacy if prompt in (None, item.get("prompt"))]
+                        return [{column: finding[column] for column in columns} for finding in findings]
+                findings = []
+                for row in rows:
+                    finding = dict(zip(columns, row))
+                    if "analysis" in finding:
+                        finding["analysis"] = json.loads(finding["analysis"])
+                    findings.append(finding)
+                return findings
+            except Exception as e:
+                logger.error(f"Failed to get findings for {document_id}: {repr(e)}")
+                raise
+
+    async def get_risk_trends(self, user_id: str, timeframe: str = "30d") -> Dict[str, Any]:
+        """Daily finding counts per risk type and severity bucket over a timeframe (7d, 30d, 90d, 1y)"""
+        if timeframe not in TREND_TIMEFRAMES:
+            raise ValueError(f"Unsupported timeframe '{timeframe}', expected one of {list(TREND_TIMEFRAMES)}")
+        start_day = (datetime.utcnow() - timedelta(days=TREND_TIMEFRAMES[timeframe] - 1)).strftime("%Y-%m-%d")
+        async with self.pool.reader() as db:
+            try:
+                cursor = await db.execute(SELECT_RISK_TRENDS, (user_id, start_day))
+                rows = await cursor.fetchall()
+            except Exception as e:
+                logger.error(f"Failed to get risk trends for user {user_id}: {repr(e)}")
+                raise
+        series = []
+        by_risk_type: Dict[str, int] = {}
+        by_severity: Dict[str, int] = {}
+        for day, risk_type, severity_bucket, count in rows:
+            series.append({"date": day, "risk_type": risk_type, "severity": severity_bucket, "count": count})
+            by_risk_type[risk_type] = by_risk_type.get(risk_type, 0) + count
+            by_severity[severity_bucket] = by_severity.get(severity_bucket, 0) + count
+        return {
+            "timeframe": timeframe,
+            "start_date": start_day,
+            "series": series,
+            "totals_by_risk_type": dict(sorted(by_risk_type.items(), key=lambda item: -item[1])),
+            "totals_by_severity": by_severity,
+            "total_findings": sum(by_risk_type.values())
+        }
+
+    async def _update_dashboard(self, db, user_id: str, documents_added: int = 0, analysis: Dict[str, Any] = None):
+        """Fold one stored document or analysis into the user's dashboard row (inside the caller's transaction)"""
+        cursor = await db.execute(SELECT_USER_DASHBOARD, (user_id,))
+        row = await cursor.fetchone()
+        dashboard = self._dashboard_from_row(row)
+        dashboard["document_count"] += documents_added
+        if analysis is not None:
+            analysis_id = analysis["analysis_id"]
+            dashboard["analysis_count"] += 1
+            dashboard["finding_count"] += analysis["findings"]
+            for counts, query in (
+                (dashboard["severity_histogram"], SEVERITY_HISTOGRAM_FOR_ANALYSIS),
+                (dashboard["risk_type_counts"], RISK_TYPES_FOR_ANALYSIS)
+            ):
+                cursor = await db.execute(query, (analysis_id,))
+                for key, count in await cursor.fetchall():
+                    counts[key] = counts.get(key, 0) + count
+            cursor = await db.execute("SELECT filename FROM documents WHERE id = ?", (analysis["document_id"],))
+            document = await cursor.fetchone()
+            recent = {**analysis, "filename": document[0] if document else None,
+                      "created_at": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")}
+            dashboard["recent_analyses"] = [recent] + dashboard["recent_analyses"][:Config.DASHBOARD_RECENT_ANALYSES - 1]
+        await db.execute(
+            """
+            INSERT OR REPLACE INTO user_dashboard
+                (user_id, document_count, analysis_count, finding_count, severity_histogram, risk_type_counts,
+                 recent_analyses, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """,
+            (
+                user_id,
+                dashboard["document_count"],
+                dashboard["analysis_count"],
+                dashboard["finding_count"],
+                json.dumps(dashboard["severity_histogram"]),
+                json.dumps(dashboard["risk_type_counts"]),
+                json.dumps(dashboard["recent_analyses"])
+            )
+        )
+
+    @staticmethod
+    def _dashboard_from_row(row) -> Dict[str, Any]:
+        if row is None:
+            return {
+                "document_count": 0, "analysis_count": 0, "finding_count": 0,
+                "severity_histogram": {}, "risk_type_counts": {}, "recent_analyses": [], "updated_at": None
+            }
+        return {
+            "document_count": row[0],
+            "analysis_count": row[1],
+            "finding_count": row[2],
+            "severity_histogram": json.loads(row[3]),
+            "risk_type_counts": json.loads(row[4]),
+            "recent_analyses": json.loads(row[5]),
+            "updated_at": row[6]
+        }
+
     async def get_user_analytics(self, user_id: str) -> Dict:
-        """Get user analytics (e.g., number of documents, recent analyses)"""
-        async with aiosqlite.connect(self.db_path) as db:
+        """Get user analytics from the materialised dashboard row (cached for a short TTL)"""
+        cached = self.dashboard_cache.get(user_id)
+        if cached is not None:
+            return cached
+        async with self.pool.reader() as db:
             try:
-                cursor = await db.execute(
-                    "SELECT COUNT(*) FROM documents WHERE user_id = ?",
-                    (user_id,)
-                )
-                doc_count = (await cursor.fetchone())[0]
-                return {"document_count": doc_count, "recent_analyses": []}  # Placeholder for recent analyses
+                cursor = await db.execute(SELECT_USER_DASHBOARD, (user_id,))
+                dashboard = self._dashboard_from_row(await cursor.fetchone())
             except Exception as e:
                 logger.error(f"Failed to get analytics for user {user_id}: {repr(e)}")
                 raise
+        risk_type_counts = dashboard.pop("risk_type_counts")
+        dashboard["top_risk_types"] = [
+            {"risk_type": risk_type, "count": count}
+            for risk_type, count in sorted(risk_type_counts.items(), key=lambda item: -item[1])[:10]
+        ]
+        self.dashboard_cache.put(user_id, dashboard)
+        return dashboard
 
@@ -0,0 +1,91 @@
+# utils/db_pool.py
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",       # readers no longer block the writer (and vice versa)
+    "synchronous": "NORMAL",     # durable at checkpoints; safe with WAL
+    "cache_size": -20000,        # ~20 MB page cache per connection
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+
+class SQLiteConnectionPool:
+    """Long-lived aiosqlite connections: one writer plus a fixed set of readers.
+
+    SQLite allows a single writer at a time, so writes are serialised on one
+    connection, while reads are spread over `readers` query-only connections.
+    Each connection keeps its own compiled-statement cache, so repeated queries
+    skip re-preparation.
+    """
+
+    def __init__(self, db_path: str, readers: int = 4, pragmas: Dict[str, object] = None,
+                 cached_statements: int = 256):
+        self.db_path = db_path
+        self.readers = max(1, readers)
+        self.pragmas = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+        self.cached_statements = cached_statements
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._reader_queue: Optional[asyncio.Queue] = None
+        self._connections: List[aiosqlite.Connection] = []
+        self._write_lock = asyncio.Lock()
+        self._open_lock = asyncio.Lock()
+
+    async def _new_connection(self, query_only: bool = False) -> aiosqlite.Connection:
+        db = await aiosqlite.connect(self.db_path, cached_statements=self.cached_statements)
+        for name, value in self.pragmas.items():
+            await db.execute(f"PRAGMA {name}={value}")
+        if query_only:
+            await db.execute("PRAGMA query_only=1")
+        self._connections.append(db)
+        return db
+
+    async def open(self):
+        async with self._open_lock:
+            if self._writer is not None:
+                return
+            # The writer goes first so journal_mode=WAL is set before readers attach
+            self._writer = await self._new_connection()
+            queue = asyncio.Queue()
+            for _ in range(self.readers):
+                queue.put_nowait(await self._new_connection(query_only=True))
+            self._reader_queue = queue
+            logger.info(f"Opened SQLite pool for {self.db_path} (1 writer, {self.readers} readers)")
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        if self._writer is None:
+            await self.open()
+        db = await self._reader_queue.get()
+        try:
+            yield db
+        finally:
+            self._reader_queue.put_nowait(db)
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Exclusive write connection; commits on success and rolls back on error"""
+        if self._writer is None:
+            await self.open()
+        async with self._write_lock:
+            try:
+                yield self._writer
+                await self._writer.commit()
+            except BaseException:
+                await self._writer.rollback()
+                raise
+
+    async def close(self):
+        async with self._open_lock:
+            connections, self._connections = self._connections, []
+            for db in connections:
+                await db.close()
+            self._writer = None
+            self._reader_queue = None
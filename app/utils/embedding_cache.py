@@ -0,0 +1,167 @@
+# utils/embedding_cache.py
+"""
+Persistent embedding cache backed by one memory-mappable float32 matrix per model.
+
+Layout of <directory>/<model>/::
+
+    vectors.f32   little-endian float32 rows of `dim` values each (append-only)
+    keys.txt      one "<sha256 of text> <row>" line per cached vector (append-only)
+    meta.json     {"model": ..., "dim": ...}
+
+Vectors are written before the key lines that reference them, and every key
+line names its row explicitly, so a writer that dies midway only leaves
+unreferenced rows behind. A torn key line is terminated by the next writer and
+skipped by readers. Appends hold an exclusive flock (where available), and
+lookups first read key lines appended since the previous lookup, so the API and
+worker processes can share one cache directory.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+_DTYPE = np.dtype("<f4")
+_KEY_LINE = re.compile(rb"([0-9a-f]{64}) (\d+)")
+
+
+@contextmanager
+def _exclusive(lock_path: Path):
+    if fcntl is None:
+        yield
+        return
+    with open(lock_path, "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class EmbeddingCache:
+    """On-disk (embedding model, text hash) -> float32 vector cache"""
+
+    def __init__(self, directory: str, model: str):
+        self.model = model
+        self.path = Path(directory) / re.sub(r"[^A-Za-z0-9_.-]", "_", model)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.path / "vectors.f32"
+        self.keys_path = self.path / "keys.txt"
+        self.meta_path = self.path / "meta.json"
+        self.lock_path = self.path / ".lock"
+        self.dim: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self._rows: Dict[str, int] = {}
+        self._keys_offset = 0
+        self._matrix: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._rows)
+
+    def _refresh(self):
+        """Pick up key lines appended since the last call, including other processes' writes"""
+        if self.dim is None and self.meta_path.exists():
+            self.dim = json.loads(self.meta_path.read_text())["dim"]
+        if not self.keys_path.exists():
+            return
+        with open(self.keys_path, "rb") as f:
+            f.seek(self._keys_offset)
+            data = f.read()
+        # A line still being written by another process is picked up next time
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            match = _KEY_LINE.fullmatch(line.strip())
+            if match is None:
+                continue  # torn line from a crashed writer
+            self._rows[match.group(1).decode("ascii")] = int(match.group(2))
+        self._keys_offset += end
+
+    def _matrix_with_rows(self, needed: int) -> np.memmap:
+        if self._matrix is None or len(self._matrix) < needed:
+            rows = os.path.getsize(self.vectors_path) // (_DTYPE.itemsize * self.dim)
+            self._matrix = np.memmap(self.vectors_path, dtype=_DTYPE, mode="r", shape=(rows, self.dim))
+        return self._matrix
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Look up several keys at once; returns only the hits (as float32 copies)"""
+        with self._lock:
+            self._refresh()
+            rows = {key: self._rows[key] for key in keys if key in self._rows}
+            found: Dict[str, np.ndarray] = {}
+            if rows:
+                matrix = self._matrix_with_rows(max(rows.values()) + 1)
+                block = np.asarray(matrix[list(rows.values())], dtype=np.float32)
+                found = dict(zip(rows, block))
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+            return found
+
+    def put_many(self, keys: List[str], vectors: np.ndarray):
+        """Append vectors for keys that are not cached yet"""
+        if not keys:
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=_DTYPE)
+        with self._lock, _exclusive(self.lock_path):
+            self._refresh()
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                self.meta_path.write_text(json.dumps({"model": self.model, "dim": self.dim}))
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match cached dimension {self.dim}")
+
+            new_rows: Dict[str, int] = {}
+            for i, key in enumerate(keys):
+                if key not in self._rows and key not in new_rows:
+                    new_rows[key] = i
+            if not new_rows:
+                return
+
+            row_bytes = _DTYPE.itemsize * self.dim
+            with open(self.vectors_path, "ab") as f:
+                size = f.seek(0, os.SEEK_END)
+                # Pad a torn row left by a crashed writer so new rows stay aligned
+                start = -(-size // row_bytes)
+                if start * row_bytes != size:
+                    f.write(b"\0" * (start * row_bytes - size))
+                f.write(vectors[list(new_rows.values())].tobytes())
+            with open(self.keys_path, "ab") as f:
+                # Terminate a torn key line left by a crashed writer so ours start on a fresh line
+                if f.seek(0, os.SEEK_END):
+                    with open(self.keys_path, "rb") as tail:
+                        tail.seek(-1, os.SEEK_END)
+                        if tail.read(1) != b"\n":
+                            f.write(b"\n")
+                f.write("".join(
+                    f"{key} {start + offset}\n" for offset, key in enumerate(new_rows)
+                ).encode("ascii"))
+            self._refresh()
+
+    def stats(self) -> Dict[str, object]:
+        lookups = self.hits + self.misses
+        return {
+            "model": self.model,
+            "entries": len(self._rows),
+            "dim": self.dim,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None
+        }
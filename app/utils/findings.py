@@ -0,0 +1,75 @@
+# utils/findings.py
+from typing import Any, Dict, Optional
+
+# Typed per-finding columns stored in analysis_findings (besides ids and the raw analysis JSON)
+FINDING_COLUMNS = [
+    "prompt",
+    "paragraph_index",
+    "paragraph",
+    "risk_type",
+    "specific_risk",
+    "severity",
+    "severity_score",
+    "velocity_score",
+    "composite_score",
+    "confidence",
+    "parse_error",
+    "analysis",
+]
+
+_MISSING = (None, "", "N/A")
+
+
+def _first(*values):
+    for value in values:
+        if value not in _MISSING:
+            return value
+    return None
+
+
+def _section(analysis: Dict[str, Any], key: str) -> Dict[str, Any]:
+    value = analysis.get(key)
+    return value if isinstance(value, dict) else {}
+
+
+def _number(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def extract_finding(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Typed fields of one paragraph x prompt result.
+
+    Handles both the flat legacy output (risk_type_1, severity_1, specific_risk)
+    and the nested registry schemas (risk_classification, risk_details,
+    confidence_assessment / confidence_metrics).
+    """
+    analysis = result.get("analysis") if isinstance(result.get("analysis"), dict) else {}
+    classification = _section(analysis, "risk_classification")
+    details = _section(analysis, "risk_details")
+    confidence = _section(analysis, "confidence_assessment") or _section(analysis, "confidence_metrics")
+
+    severity_score = _first(classification.get("severity_score"), analysis.get("severity_score"))
+    severity = _first(analysis.get("severity_1"), analysis.get("severity"), severity_score)
+    return {
+        "prompt": result.get("prompt"),
+        "paragraph_index": result.get("paragraph_index"),
+        "paragraph": result.get("paragraph"),
+        "risk_type": _first(analysis.get("risk_type_1"), classification.get("primary_risk_type"), analysis.get("risk_type")),
+        "specific_risk": _first(analysis.get("specific_risk"), details.get("risk_driver")),
+        "severity": str(severity) if severity is not None else None,
+        "severity_score": _number(_first(severity_score, severity)),
+        "velocity_score": _number(_first(classification.get("velocity_score"), analysis.get("velocity_score"))),
+        "composite_score": _number(classification.get("composite_risk_score")),
+        "confidence": _number(_first(
+            confidence.get("overall_confidence"),
+            confidence.get("confidence_level"),
+            analysis.get("confidence_level"),
+            analysis.get("confidence")
+        )),
+        # LLM output that could not be parsed; stored for completeness, excluded from aggregates
+        "parse_error": "error" in analysis,
+        "analysis": analysis,
+    }
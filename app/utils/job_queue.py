@@ -0,0 +1,449 @@
+# utils/job_queue.py
+"""
+Durable job queue used for long-running work such as risk analyses.
+
+Jobs live in a backend (SQLite by default) instead of process memory, so every
+API worker sees the same state and in-flight jobs survive restarts. Workers
+claim jobs under a lease that they renew with heartbeats; a job whose lease
+expires is handed to another worker, which can resume from the job's stored
+checkpoint and partial results.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+PROCESSING = "processing"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATUSES = (COMPLETED, FAILED, CANCELLED)
+
+
+class JobBackend(ABC):
+    """Interface for job storage backends; subclasses must implement every abstract method"""
+
+    async def initialize(self):
+        pass
+
+    async def close(self):
+        pass
+
+    @abstractmethod
+    async def enqueue(self, job_type: str, payload: Dict[str, Any], user_id: str = None,
+                      priority: int = 0, max_attempts: int = 3, resume_key: str = None) -> str:
+        """Queue a job; if a job with the same resume_key is already pending or running, return its id"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def claim(self, worker_id: str, job_types: List[str], lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """Atomically take the highest-priority runnable job (pending, or with an expired lease)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> Dict[str, bool]:
+        """Extend the lease; returns {"owned": ..., "cancel_requested": ...}"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def save_progress(self, job_id: str, worker_id: str, progress: float = None,
+                            completed_items: int = None, total_items: int = None,
+                            checkpoint: Dict[str, Any] = None, results: List[Dict[str, Any]] = None):
+        """Persist progress, checkpoint and newly completed partial results in one transaction"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def complete(self, job_id: str, worker_id: str, result: Dict[str, Any]):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def fail(self, job_id: str, worker_id: str, error_message: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def release(self, job_id: str, worker_id: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def mark_cancelled(self, job_id: str, worker_id: str = None):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def request_cancel(self, job_id: str) -> bool:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def get_results(self, job_id: str, cursor: int = 0) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def adopt_results(self, job_id: str) -> int:
+        """Copy partial results of the latest failed/cancelled job with the same resume_key; returns the count"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def cleanup(self, ttl_seconds: float) -> int:
+        """Fail abandoned jobs and delete finished jobs older than ttl_seconds; returns the number removed"""
+        raise NotImplementedError
+
+
+class SQLiteJobBackend(JobBackend):
+    """Job backend on a local SQLite file (WAL mode, safe across processes)"""
+
+    def __init__(self, db_path: str = "finriskgpt_jobs.db"):
+        self.db_path = db_path
+        self._db: Optional[aiosqlite.Connection] = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self) -> aiosqlite.Connection:
+        if self._db is None:
+            db = await aiosqlite.connect(self.db_path, isolation_level=None)
+            db.row_factory = aiosqlite.Row
+            await db.execute("PRAGMA journal_mode=WAL")
+            await db.execute("PRAGMA busy_timeout=5000")
+            self._db = db
+        return self._db
+
+    async def initialize(self):
+        async with self._lock:
+            db = await self._connect()
+            try:
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS jobs (
+                        id TEXT PRIMARY KEY,
+                        job_type TEXT NOT NULL,
+                        user_id TEXT,
+                        payload TEXT NOT NULL,
+                        priority INTEGER NOT NULL DEFAULT 0,
+                        status TEXT NOT NULL,
+                        progress REAL NOT NULL DEFAULT 0,
+                        completed_items INTEGER NOT NULL DEFAULT 0,
+                        total_items INTEGER NOT NULL DEFAULT 0,
+                        checkpoint TEXT,
+                        result TEXT,
+                        error_message TEXT,
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        max_attempts INTEGER NOT NULL DEFAULT 3,
+                        lease_owner TEXT,
+                        lease_expires_at REAL,
+                        cancel_requested INTEGER NOT NULL DEFAULT 0,
+                        resume_key TEXT,
+                        created_at REAL NOT NULL,
+                        updated_at REAL NOT NULL,
+                        finished_at REAL
+                    )
+                """)
+                await db.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_jobs_runnable ON jobs(status, priority DESC, created_at)"
+                )
+                await db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs(finished_at)")
+                columns = {row[1] for row in await db.execute_fetchall("PRAGMA table_info(jobs)")}
+                if "resume_key" not in columns:
+                    await db.execute("ALTER TABLE jobs ADD COLUMN resume_key TEXT")
+                await db.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_jobs_resume_key ON jobs(job_type, user_id, resume_key, created_at)"
+                )
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS job_results (
+                        job_id TEXT NOT NULL,
+                        seq INTEGER NOT NULL,
+                        result TEXT NOT NULL,
+                        PRIMARY KEY (job_id, seq)
+                    )
+                """)
+            except Exception as e:
+                logger.error(f"Job queue initialization failed: {repr(e)}")
+                raise
+
+    async def close(self):
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+    @staticmethod
+    def _row_to_job(row) -> Dict[str, Any]:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["checkpoint"] = json.loads(job["checkpoint"]) if job["checkpoint"] else None
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    async def enqueue(self, job_type: str, payload: Dict[str, Any], user_id: str = None,
+                      priority: int = 0, max_attempts: int = 3, resume_key: str = None) -> str:
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        async with self._lock:
+            db = await self._connect()
+            await db.execute("BEGIN IMMEDIATE")
+            try:
+                if resume_key is not None:
+                    cursor = await db.execute(
+                        """
+                        SELECT id FROM jobs
+                        WHERE job_type = ? AND user_id IS ? AND resume_key = ? AND status IN (?, ?) AND cancel_requested = 0
+                        ORDER BY created_at DESC LIMIT 1
+                        """,
+                        (job_type, user_id, resume_key, PENDING, PROCESSING)
+                    )
+                    active = await cursor.fetchone()
+                    if active is not None:
+                        await db.execute("COMMIT")
+                        return active[0]
+                await db.execute(
+                    """
+                    INSERT INTO jobs (id, job_type, user_id, payload, priority, status, max_attempts, resume_key,
+                                      created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (job_id, job_type, user_id, json.dumps(payload), priority, PENDING, max_attempts, resume_key, now, now)
+                )
+                await db.execute("COMMIT")
+            except Exception:
+                await db.execute("ROLLBACK")
+                raise
+        return job_id
+
+    async def claim(self, worker_id: str, job_types: List[str], lease_seconds: float) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        placeholders = ",".join("?" * len(job_types))
+        async with self._lock:
+            db = await self._connect()
+            # Single UPDATE ... RETURNING keeps the claim atomic across processes
+            cursor = await db.execute(
+                f"""
+                UPDATE jobs
+                SET status = ?, lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1, updated_at = ?
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE job_type IN ({placeholders})
+                      AND cancel_requested = 0
+                      AND attempts < max_attempts
+                      AND (status = ? OR (status = ? AND lease_expires_at < ?))
+                    ORDER BY priority DESC, created_at
+                    LIMIT 1
+                )
+                RETURNING *
+                """,
+                (PROCESSING, worker_id, now + lease_seconds, now, *job_types, PENDING, PROCESSING, now)
+            )
+            row = await cursor.fetchone()
+        return self._row_to_job(row) if row else None
+
+    async def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> Dict[str, bool]:
+        now = time.time()
+        async with self._lock:
+            db = await self._connect()
+            cursor = await db.execute(
+                """
+                UPDATE jobs SET lease_expires_at = ?, updated_at = ?
+                WHERE id = ? AND lease_owner = ? AND status = ?
+                RETURNING cancel_requested
+                """,
+                (now + lease_seconds, now, job_id, worker_id, PROCESSING)
+            )
+            row = await cursor.fetchone()
+        return {"owned": row is not None, "cancel_requested": bool(row[0]) if row else False}
+
+    async def save_progress(self, job_id: str, worker_id: str, progress: float = None,
+                            completed_items: int = None, total_items: int = None,
+                            checkpoint: Dict[str, Any] = None, results: List[Dict[str, Any]] = None):
+        async with self._lock:
+            db = await self._connect()
+            await db.execute("BEGIN IMMEDIATE")
+            try:
+                if results:
+                    cursor = await db.execute(
+                        "SELECT COALESCE(MAX(seq), -1) + 1 FROM job_results WHERE job_id = ?", (job_id,)
+                    )
+                    next_seq = (await cursor.fetchone())[0]
+                    await db.executemany(
+                        "INSERT INTO job_results (job_id, seq, result) VALUES (?, ?, ?)",
+                        [(job_id, next_seq + i, json.dumps(result)) for i, result in enumerate(results)]
+                    )
+                await db.execute(
+                    """
+                    UPDATE jobs SET
+                        progress = COALESCE(?, progress),
+                        completed_items = COALESCE(?, completed_items),
+                        total_items = COALESCE(?, total_items),
+                        checkpoint = COALESCE(?, checkpoint),
+                        updated_at = ?
+                    WHERE id = ? AND lease_owner = ?
+                    """,
+                    (
+                        progress, completed_items, total_items,
+                        json.dumps(checkpoint) if checkpoint is not None else None,
+                        time.time(), job_id, worker_id
+                    )
+                )
+                await db.execute("COMMIT")
+            except Exception:
+                await db.execute("ROLLBACK")
+                raise
+
+    async def _finish(self, job_id: str, worker_id: Optional[str], status: str,
+                      result: Dict[str, Any] = None, error_message: str = None):
+        now = time.time()
+        owner_clause = "AND lease_owner = ?" if worker_id else ""
+        params = [
+            status,
+            json.dumps(result) if result is not None else None,
+            error_message,
+            100.0 if status == COMPLETED else None,
+            now, now, job_id
+        ]
+        if worker_id:
+            params.append(worker_id)
+        async with self._lock:
+            db = await self._connect()
+            await db.execute(
+                f"""
+                UPDATE jobs SET status = ?, result = ?, error_message = ?, progress = COALESCE(?, progress),
+                    lease_owner = NULL, lease_expires_at = NULL, finished_at = ?, updated_at = ?
+                WHERE id = ? {owner_clause}
+                """,
+                params
+            )
+
+    async def complete(self, job_id: str, worker_id: str, result: Dict[str, Any]):
+        await self._finish(job_id, worker_id, COMPLETED, result=result)
+
+    async def fail(self, job_id: str, worker_id: str, error_message: str):
+        await self._finish(job_id, worker_id, FAILED, error_message=error_message)
+
+    async def release(self, job_id: str, worker_id: str):
+        """Hand a job back to the queue on graceful shutdown (does not count as an attempt)"""
+        async with self._lock:
+            db = await self._connect()
+            await db.execute(
+                """
+                UPDATE jobs SET status = ?, lease_owner = NULL, lease_expires_at = NULL,
+                    attempts = MAX(attempts - 1, 0), updated_at = ?
+                WHERE id = ? AND lease_owner = ? AND status = ?
+                """,
+                (PENDING, time.time(), job_id, worker_id, PROCESSING)
+            )
+
+    async def mark_cancelled(self, job_id: str, worker_id: str = None):
+        await self._finish(job_id, worker_id, CANCELLED, error_message="Cancelled")
+
+    async def request_cancel(self, job_id: str) -> bool:
+        now = time.time()
+        async with self._lock:
+            db = await self._connect()
+            # Pending jobs are cancelled immediately; running ones are stopped by their worker's heartbeat
+            cursor = await db.execute(
+                """
+                UPDATE jobs SET cancel_requested = 1, updated_at = ?,
+                    status = CASE WHEN status = ? THEN ? ELSE status END,
+                    finished_at = CASE WHEN status = ? THEN ? ELSE finished_at END
+                WHERE id = ? AND status IN (?, ?)
+                """,
+                (now, PENDING, CANCELLED, PENDING, now, job_id, PENDING, PROCESSING)
+            )
+            return cursor.rowcount > 0
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        db = await self._connect()
+        cursor = await db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        row = await cursor.fetchone()
+        return self._row_to_job(row) if row else None
+
+    async def get_results(self, job_id: str, cursor: int = 0) -> List[Dict[str, Any]]:
+        db = await self._connect()
+        rows = await db.execute_fetchall(
+            "SELECT result FROM job_results WHERE job_id = ? AND seq >= ? ORDER BY seq", (job_id, cursor)
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    async def adopt_results(self, job_id: str) -> int:
+        async with self._lock:
+            db = await self._connect()
+            await db.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = await db.execute(
+                    """
+                    SELECT previous.id FROM jobs AS current
+                    JOIN jobs AS previous
+                      ON previous.job_type = current.job_type
+                     AND previous.user_id IS current.user_id
+                     AND previous.resume_key = current.resume_key
+                    WHERE current.id = ? AND previous.id != current.id AND previous.status IN (?, ?)
+                      AND NOT EXISTS (SELECT 1 FROM job_results WHERE job_id = current.id)
+                    ORDER BY previous.created_at DESC
+                    LIMIT 1
+                    """,
+                    (job_id, FAILED, CANCELLED)
+                )
+                previous = await cursor.fetchone()
+                adopted = 0
+                if previous is not None:
+                    cursor = await db.execute(
+                        "INSERT INTO job_results (job_id, seq, result) SELECT ?, seq, result FROM job_results WHERE job_id = ?",
+                        (job_id, previous[0])
+                    )
+                    adopted = cursor.rowcount
+                await db.execute("COMMIT")
+            except Exception:
+                await db.execute("ROLLBACK")
+                raise
+        if adopted:
+            logger.info(f"Job {job_id} adopted {adopted} results from job {previous[0]}")
+        return adopted
+
+    async def cleanup(self, ttl_seconds: float) -> int:
+        cutoff = time.time() - ttl_seconds
+        placeholders = ",".join("?" * len(FINISHED_STATUSES))
+        async with self._lock:
+            db = await self._connect()
+            await db.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs whose lease expired after their last allowed attempt will never be claimed again
+                now = time.time()
+                await db.execute(
+                    """
+                    UPDATE jobs SET status = ?, error_message = ?, lease_owner = NULL, finished_at = ?, updated_at = ?
+                    WHERE status = ? AND lease_expires_at < ? AND attempts >= max_attempts
+                    """,
+                    (FAILED, "Worker lease expired too many times", now, now, PROCESSING, now)
+                )
+                await db.execute(
+                    f"""
+                    DELETE FROM job_results WHERE job_id IN (
+                        SELECT id FROM jobs WHERE status IN ({placeholders}) AND finished_at < ?
+                    )
+                    """,
+                    (*FINISHED_STATUSES, cutoff)
+                )
+                cursor = await db.execute(
+                    f"DELETE FROM jobs WHERE status IN ({placeholders}) AND finished_at < ?",
+                    (*FINISHED_STATUSES, cutoff)
+                )
+                await db.execute("COMMIT")
+            except Exception:
+                await db.execute("ROLLBACK")
+                raise
+        if cursor.rowcount:
+            logger.info(f"Removed {cursor.rowcount} finished jobs older than {ttl_seconds:.0f}s")
+        return cursor.rowcount
+
+
+def create_job_backend(url: str) -> JobBackend:
+    """Build a backend from a URL, e.g. ``sqlite:///finriskgpt_jobs.db``"""
+    if url.startswith("sqlite:///"):
+        return SQLiteJobBackend(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported job backend: {url}")
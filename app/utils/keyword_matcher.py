@@ -0,0 +1,109 @@
+# utils/keyword_matcher.py
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+
+try:
+    import ahocorasick  # pyahocorasick, C implementation of the same automaton
+    ahocorasick_available = True
+except ImportError:
+    ahocorasick = None
+    ahocorasick_available = False
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton over categorised keyword dictionaries.
+
+    Built once from {category: [terms]}; scan() then finds every term of every
+    category in a single pass over the text, independent of how many terms the
+    dictionaries hold. Matching is case-insensitive substring matching, i.e. the
+    same semantics as `term.lower() in text.lower()`.
+    """
+
+    def __init__(self, dictionaries: Dict[str, Iterable[str]]):
+        self.categories = list(dictionaries)
+        self._terms: List[str] = []
+        self._term_categories: List[Tuple[str, ...]] = []
+        index: Dict[str, int] = {}
+        for category, terms in dictionaries.items():
+            for term in terms:
+                key = term.lower()
+                if not key:
+                    continue
+                term_id = index.get(key)
+                if term_id is None:
+                    term_id = index[key] = len(self._terms)
+                    self._terms.append(term)
+                    self._term_categories.append(())
+                if category not in self._term_categories[term_id]:
+                    self._term_categories[term_id] += (category,)
+
+        if ahocorasick_available:
+            self._automaton = ahocorasick.Automaton()
+            for key, term_id in index.items():
+                self._automaton.add_word(key, term_id)
+            if index:
+                self._automaton.make_automaton()
+        else:
+            self._automaton = None
+            self._build(index)
+
+    def _build(self, index: Dict[str, int]):
+        goto: List[Dict[str, int]] = [{}]
+        output: List[Tuple[int, ...]] = [()]
+        for key, term_id in index.items():
+            node = 0
+            for ch in key:
+                nxt = goto[node].get(ch)
+                if nxt is None:
+                    nxt = goto[node][ch] = len(goto)
+                    goto.append({})
+                    output.append(())
+                node = nxt
+            output[node] += (term_id,)
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(ch, 0)
+                # Terms ending at the fallback state also end here
+                output[child] += output[fail[child]]
+        self._goto = goto
+        self._fail = fail
+        self._output = output
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def _iter_ends(self, text: str) -> Iterable[Tuple[int, int]]:
+        """(inclusive end offset, term id) for every occurrence"""
+        if self._automaton is not None:
+            if self._terms:
+                yield from self._automaton.iter(text)
+            return
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for pos, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for term_id in output[node]:
+                yield pos, term_id
+
+    def scan(self, text: str) -> Dict[str, List[str]]:
+        """Distinct terms found per category, in dictionary order"""
+        found = sorted({term_id for _, term_id in self._iter_ends(text.lower())})
+        hits: Dict[str, List[str]] = {category: [] for category in self.categories}
+        for term_id in found:
+            for category in self._term_categories[term_id]:
+                hits[category].append(self._terms[term_id])
+        return hits
+
+    def counts(self, text: str) -> Dict[str, int]:
+        """Number of distinct terms found per category"""
+        return {category: len(terms) for category, terms in self.scan(text).items()}
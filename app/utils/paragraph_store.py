@@ -0,0 +1,181 @@
+# utils/paragraph_store.py
+"""
+Compact on-disk paragraph store for processed documents.
+
+Layout (all integers little-endian)::
+
+    [magic "FRPS"][version u16][reserved u16]
+    [text blob: UTF-8 paragraph texts, concatenated]      (padded to 8 bytes)
+    [offsets  u64 * (count + 1)]  byte offsets of each text inside the blob
+    [pages    u32 * count]        page number per paragraph
+    [sections u16 * count]        index into header["sections"]
+    [header JSON]                 document_id, document metadata, section names, count
+    [footer: header_offset u64][header_length u32][magic "FRPS"]
+
+Document-level metadata is stored once in the header; per-paragraph fields are
+stored as fixed-width arrays, so a reader can memory-map the file and slice any
+paragraph range without parsing the rest of the document.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+MAGIC = b"FRPS"
+FORMAT_VERSION = 1
+STORE_SUFFIX = ".paragraphs"
+_PREAMBLE = struct.Struct("<4sHH")
+_FOOTER = struct.Struct("<QI4s")
+
+
+def _to_le(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_le(typecode: str, data) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+class ParagraphStoreWriter:
+    """Streams paragraphs to a store file; the file is published atomically on close()"""
+
+    def __init__(self, path: str, document_id: str, metadata: Dict[str, Any]):
+        self.path = Path(path)
+        self.partial_path = self.path.with_name(self.path.name + ".partial")
+        self.document_id = document_id
+        self.metadata = metadata
+        self.offsets = array("Q", [0])
+        self.pages = array("I")
+        self.sections = array("H")
+        self.section_names: List[str] = []
+        self._section_ids: Dict[str, int] = {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.partial_path, "wb")
+        self._file.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, 0))
+        self._text_start = _PREAMBLE.size
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def append(self, text: str, page_number: int, section_name: str):
+        """Append one paragraph"""
+        section_id = self._section_ids.get(section_name)
+        if section_id is None:
+            section_id = self._section_ids[section_name] = len(self.section_names)
+            self.section_names.append(section_name)
+        encoded = text.encode("utf-8")
+        self._file.write(encoded)
+        self.offsets.append(self.offsets[-1] + len(encoded))
+        self.pages.append(page_number)
+        self.sections.append(section_id)
+
+    def close(self):
+        """Write index arrays, header and footer, then move the file into place"""
+        text_end = self._text_start + self.offsets[-1]
+        self._file.write(b"\0" * (-text_end % 8))
+        self._file.write(_to_le(self.offsets))
+        self._file.write(_to_le(self.pages))
+        self._file.write(_to_le(self.sections))
+        header = json.dumps({
+            "document_id": self.document_id,
+            "metadata": self.metadata,
+            "sections": self.section_names,
+            "count": len(self.pages),
+            "text_start": self._text_start
+        }, ensure_ascii=False).encode("utf-8")
+        header_offset = self._file.tell()
+        self._file.write(header)
+        self._file.write(_FOOTER.pack(header_offset, len(header), MAGIC))
+        self._file.close()
+        os.replace(self.partial_path, self.path)
+
+    def abort(self):
+        """Discard a partially written store"""
+        self._file.close()
+        if self.partial_path.exists():
+            self.partial_path.unlink()
+
+
+class ParagraphStoreReader:
+    """Memory-mapped random-access reader for a paragraph store file"""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, _ = _PREAMBLE.unpack_from(self._mm, 0)
+            header_offset, header_length, footer_magic = _FOOTER.unpack_from(self._mm, len(self._mm) - _FOOTER.size)
+            if magic != MAGIC or footer_magic != MAGIC:
+                raise ValueError(f"Not a paragraph store: {self.path}")
+            if version != FORMAT_VERSION:
+                raise ValueError(f"Unsupported paragraph store version {version}: {self.path}")
+            header = json.loads(self._mm[header_offset:header_offset + header_length].decode("utf-8"))
+        except Exception:
+            self._mm.close()
+            raise
+
+        self.document_id: str = header["document_id"]
+        self.metadata: Dict[str, Any] = header["metadata"]
+        self.sections: List[str] = header["sections"]
+        self.count: int = header["count"]
+        self._text_start: int = header["text_start"]
+
+        # Index arrays sit directly before the header
+        pos = header_offset - 8 * (self.count + 1) - 4 * self.count - 2 * self.count
+        self.offsets = _from_le("Q", self._mm[pos:pos + 8 * (self.count + 1)])
+        pos += 8 * (self.count + 1)
+        self.pages = _from_le("I", self._mm[pos:pos + 4 * self.count])
+        pos += 4 * self.count
+        self.section_ids = _from_le("H", self._mm[pos:pos + 2 * self.count])
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._mm.close()
+
+    def text(self, index: int) -> str:
+        """Decode a single paragraph text without touching the others"""
+        start = self._text_start + self.offsets[index]
+        end = self._text_start + self.offsets[index + 1]
+        return self._mm[start:end].decode("utf-8")
+
+    def paragraph(self, index: int) -> Dict[str, Any]:
+        """Rebuild the paragraph dict in the same shape process_pdf produces"""
+        return {
+            "content": self.text(index),
+            "metadata": {
+                **self.metadata,
+                "page_number": self.pages[index],
+                "section_name": self.sections[self.section_ids[index]]
+            }
+        }
+
+    def paragraphs(self, start: int = 0, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Return paragraphs in [start, stop)"""
+        start, stop, _ = slice(start, stop).indices(self.count)
+        return [self.paragraph(i) for i in range(start, stop)]
+
+
+def store_path_for(storage_dir: str, document_id: str) -> Path:
+    """Path of the paragraph store for a document"""
+    return Path(storage_dir) / f"{document_id}{STORE_SUFFIX}"
@@ -21,6 +21,33 @@ class RAGConfig:
     CACHE_ENABLED: bool = True
     LLM_TEMPERATURE: float = 0.1
     MAX_TOKENS: int = 1000
+    PDF_EXTRACTION_WORKERS: int = int(os.getenv("PDF_EXTRACTION_WORKERS", "0"))  # 0 -> 串行提取
+    PDF_PARALLEL_MIN_PAGES: int = 40
+    PARAGRAPH_CACHE_SIZE: int = 32  # 缓存的已解析文档数量
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+    LLM_REQUESTS_PER_MINUTE: int = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+    LLM_TOKENS_PER_MINUTE: int = int(os.getenv("LLM_TOKENS_PER_MINUTE", "150000"))
+    LLM_MAX_RETRIES: int = 5
+    LLM_ADHOC_TEMPLATE_CACHE_SIZE: int = 256  # 按模板文本哈希缓存的非注册提示词模板数量
+    LLM_MAX_CONNECTIONS: int = 64  # 共享HTTP连接池上限（keep-alive）
+    LLM_KEEPALIVE_EXPIRY: float = 30.0
+    LLM_RETRY_BASE_DELAY: float = 1.0
+    LLM_RETRY_MAX_DELAY: float = 60.0
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_PATH: str = os.getenv("RESULT_CACHE_PATH", "analysis_cache.db")
+    RESULT_CACHE_MAX_MB: int = 512
+    RISK_BATCH_SIZE: int = int(os.getenv("RISK_BATCH_SIZE", "0"))  # 每次请求打包的段落数，0/1 表示不打包
+    SPACY_BATCH_SIZE: int = 64  # nlp.pipe 每批处理的chunk数
+    SPACY_N_PROCESS: int = int(os.getenv("SPACY_N_PROCESS", "1"))  # >1 时使用多进程
+    CHUNK_SUMMARY_CONCURRENCY: int = 8  # 单次构建中并发生成摘要的上限（另受LLM调度器总并发约束）
+    DEFER_CHUNK_SUMMARIES: bool = os.getenv("DEFER_CHUNK_SUMMARIES", "false").lower() == "true"  # 先建库后回填摘要
+    SUMMARY_CACHE_ENABLED: bool = True
+    SUMMARY_CACHE_PATH: str = os.getenv("SUMMARY_CACHE_PATH", "summary_cache.db")
+    SUMMARY_CACHE_MAX_MB: int = 64
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_DIR: str = os.getenv("EMBEDDING_CACHE_DIR", "embedding_cache")
+    EMBEDDING_BATCH_SIZE: int = 256  # 每次embedding请求的文本数
+    EMBEDDING_CONCURRENCY: int = 4  # 并发的embedding请求数
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
 
     @classmethod
@@ -41,5 +68,32 @@ class RAGConfig:
             "cache_enabled": cls.CACHE_ENABLED,
             "llm_temperature": cls.LLM_TEMPERATURE,
             "max_tokens": cls.MAX_TOKENS,
+            "pdf_extraction_workers": cls.PDF_EXTRACTION_WORKERS,
+            "pdf_parallel_min_pages": cls.PDF_PARALLEL_MIN_PAGES,
+            "paragraph_cache_size": cls.PARAGRAPH_CACHE_SIZE,
+            "llm_max_concurrency": cls.LLM_MAX_CONCURRENCY,
+            "llm_requests_per_minute": cls.LLM_REQUESTS_PER_MINUTE,
+            "llm_tokens_per_minute": cls.LLM_TOKENS_PER_MINUTE,
+            "llm_max_retries": cls.LLM_MAX_RETRIES,
+            "llm_adhoc_template_cache_size": cls.LLM_ADHOC_TEMPLATE_CACHE_SIZE,
+            "llm_max_connections": cls.LLM_MAX_CONNECTIONS,
+            "llm_keepalive_expiry": cls.LLM_KEEPALIVE_EXPIRY,
+            "llm_retry_base_delay": cls.LLM_RETRY_BASE_DELAY,
+            "llm_retry_max_delay": cls.LLM_RETRY_MAX_DELAY,
+            "risk_batch_size": cls.RISK_BATCH_SIZE,
+            "spacy_batch_size": cls.SPACY_BATCH_SIZE,
+            "spacy_n_process": cls.SPACY_N_PROCESS,
+            "chunk_summary_concurrency": cls.CHUNK_SUMMARY_CONCURRENCY,
+            "defer_chunk_summaries": cls.DEFER_CHUNK_SUMMARIES,
+            "summary_cache_enabled": cls.SUMMARY_CACHE_ENABLED,
+            "summary_cache_path": cls.SUMMARY_CACHE_PATH,
+            "summary_cache_max_mb": cls.SUMMARY_CACHE_MAX_MB,
+            "embedding_cache_enabled": cls.EMBEDDING_CACHE_ENABLED,
+            "embedding_cache_dir": cls.EMBEDDING_CACHE_DIR,
+            "embedding_batch_size": cls.EMBEDDING_BATCH_SIZE,
+            "embedding_concurrency": cls.EMBEDDING_CONCURRENCY,
+            "result_cache_enabled": cls.RESULT_CACHE_ENABLED,
+            "result_cache_path": cls.RESULT_CACHE_PATH,
+            "result_cache_max_mb": cls.RESULT_CACHE_MAX_MB,
             "openai_api_key": cls.OPENAI_API_KEY
         }
\ No newline at end of file
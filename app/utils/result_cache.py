@@ -0,0 +1,145 @@
+# utils/result_cache.py
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_paragraph(text: str) -> str:
+    """Normalise paragraph text so formatting-only differences share a cache entry"""
+    text = text.replace("’", "'").replace("‘", "'").replace("“", '"').replace("”", '"')
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class AnalysisResultCache:
+    """Durable cache of per-paragraph LLM analyses.
+
+    Entries are keyed by (prompt id, prompt version, model, normalised paragraph
+    hash) and evicted least-recently-used once the stored payload exceeds max_bytes.
+    """
+
+    def __init__(self, db_path: str = "analysis_cache.db", max_bytes: int = 512 * 1024 * 1024,
+                 evict_every: int = 200):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self._db: Optional[aiosqlite.Connection] = None
+        self._lock = asyncio.Lock()
+        self._writes_since_evict = 0
+
+    @staticmethod
+    def make_key(prompt_id: str, prompt_version: str, model: str, paragraph: str) -> str:
+        paragraph_hash = hashlib.sha256(normalize_paragraph(paragraph).encode("utf-8")).hexdigest()
+        return f"{prompt_id}:{prompt_version}:{model}:{paragraph_hash}"
+
+    async def _connect(self) -> aiosqlite.Connection:
+        async with self._lock:
+            if self._db is None:
+                db = await aiosqlite.connect(self.db_path)
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS analysis_cache (
+                        key TEXT PRIMARY KEY,
+                        analysis TEXT NOT NULL,
+                        size INTEGER NOT NULL,
+                        created_at REAL NOT NULL,
+                        last_accessed REAL NOT NULL
+                    )
+                """)
+                await db.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_analysis_cache_last_accessed ON analysis_cache(last_accessed)"
+                )
+                await db.commit()
+                self._db = db
+        return self._db
+
+    async def get_many(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Look up several keys at once; returns only the hits"""
+        if not keys:
+            return {}
+        db = await self._connect()
+        found = {}
+        try:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                cursor = await db.execute(
+                    f"SELECT key, analysis FROM analysis_cache WHERE key IN ({placeholders})", batch
+                )
+                for key, analysis in await cursor.fetchall():
+                    found[key] = json.loads(analysis)
+            if found:
+                now = time.time()
+                await db.executemany(
+                    "UPDATE analysis_cache SET last_accessed = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Analysis cache lookup failed: {repr(e)}")
+            found = {}
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    async def put_many(self, entries: Dict[str, Dict[str, Any]]):
+        """Store analyses; failures are logged and never break the analysis itself"""
+        if not entries:
+            return
+        db = await self._connect()
+        now = time.time()
+        rows = []
+        for key, analysis in entries.items():
+            payload = json.dumps(analysis, ensure_ascii=False)
+            rows.append((key, payload, len(payload), now, now))
+        try:
+            await db.executemany(
+                "INSERT OR REPLACE INTO analysis_cache (key, analysis, size, created_at, last_accessed) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            await db.commit()
+            self._writes_since_evict += len(rows)
+            if self._writes_since_evict >= self.evict_every:
+                self._writes_since_evict = 0
+                await self._evict(db)
+        except Exception as e:
+            logger.error(f"Analysis cache write failed: {repr(e)}")
+
+    async def _evict(self, db: aiosqlite.Connection):
+        """Keep the most recently used entries whose cumulative size fits in max_bytes"""
+        cursor = await db.execute(
+            """
+            DELETE FROM analysis_cache WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, SUM(size) OVER (ORDER BY last_accessed DESC, key) AS running
+                    FROM analysis_cache
+                ) WHERE running > ?
+            )
+            """,
+            (self.max_bytes,)
+        )
+        await db.commit()
+        if cursor.rowcount:
+            logger.info(f"Evicted {cursor.rowcount} analysis cache entries")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else None
+        }
+
+    async def close(self):
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
@@ -0,0 +1,100 @@
+# utils/uploads.py
+import hashlib
+import logging
+import os
+import tempfile
+from typing import Dict, Any, Optional
+
+import aiofiles
+from fastapi import UploadFile
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds the configured size limit."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        super().__init__(f"Upload exceeds maximum size of {max_bytes // (1024 * 1024)} MB")
+
+
+class ContentLengthRequiredError(ValueError):
+    """Raised when an upload request does not declare its size up front."""
+
+    def __init__(self):
+        super().__init__("Uploads must send a Content-Length header")
+
+
+# Multipart framing (boundary lines and part headers) sent on top of the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+def check_content_length(content_length: Optional[str], max_bytes: Optional[int] = None):
+    """Reject an upload request by its Content-Length header, before the body is received.
+
+    The framework spools the whole multipart body before the endpoint runs, so
+    this has to run in middleware; stream_upload_to_disk still enforces the
+    limit on the file itself.
+
+    Raises:
+        ContentLengthRequiredError: If the header is missing or not a number.
+        UploadTooLargeError: If the declared body exceeds ``max_bytes`` plus multipart framing.
+    """
+    max_bytes = max_bytes or Config.MAX_UPLOAD_SIZE_MB * 1024 * 1024
+    if content_length is None or not content_length.isdigit():
+        raise ContentLengthRequiredError()
+    if int(content_length) > max_bytes + MULTIPART_OVERHEAD_BYTES:
+        raise UploadTooLargeError(max_bytes)
+
+
+async def stream_upload_to_disk(
+    file: UploadFile,
+    suffix: str = ".pdf",
+    max_bytes: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    tmp_dir: Optional[str] = None
+) -> Dict[str, Any]:
+    """Stream an uploaded file to a temporary file in fixed-size chunks.
+
+    Only one chunk is held in memory at a time. The size limit is enforced
+    while streaming and the SHA-256 of the content is computed in the same pass.
+
+    Returns:
+        Dict with ``path``, ``size`` (bytes) and ``sha256`` (hex digest).
+
+    Raises:
+        UploadTooLargeError: If the upload exceeds ``max_bytes``. The partial
+            file is removed before raising.
+    """
+    max_bytes = max_bytes or Config.MAX_UPLOAD_SIZE_MB * 1024 * 1024
+    chunk_size = chunk_size or Config.UPLOAD_CHUNK_SIZE
+    tmp_dir = tmp_dir or Config.UPLOAD_TMP_DIR
+    if tmp_dir:
+        os.makedirs(tmp_dir, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(suffix=suffix, dir=tmp_dir)
+    os.close(fd)
+
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(max_bytes)
+                hasher.update(chunk)
+                await out.write(chunk)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+    logger.info(f"Streamed upload {file.filename} to {tmp_path} ({size} bytes)")
+    return {"path": tmp_path, "size": size, "sha256": hasher.hexdigest()}
@@ -0,0 +1,100 @@
+# utils/write_queue.py
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+import aiosqlite
+
+from .db_pool import SQLiteConnectionPool
+
+logger = logging.getLogger(__name__)
+
+WriteOp = Callable[[aiosqlite.Connection], Awaitable[Any]]
+
+
+class WriteBehindQueue:
+    """Coalesces writes from many coroutines into grouped transactions.
+
+    Each submitted operation runs inside its own SAVEPOINT, so a failing write
+    is rolled back alone while the rest of the batch commits together. A batch
+    is committed once max_batch operations are queued or max_delay seconds have
+    passed since the first one. submit() returns a future that resolves with the
+    operation's result after its transaction has committed.
+    """
+
+    def __init__(self, pool: SQLiteConnectionPool, max_batch: int = 200, max_delay: float = 0.02):
+        self.pool = pool
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.batches = 0
+        self.operations = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, op: WriteOp) -> asyncio.Future:
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((op, future))
+        return future
+
+    async def stop(self):
+        """Commit everything already queued, then stop the writer task"""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        self._queue = None
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = asyncio.get_running_loop().time() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - asyncio.get_running_loop().time()
+                try:
+                    item = self._queue.get_nowait() if timeout <= 0 else await asyncio.wait_for(self._queue.get(), timeout)
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._commit_batch(batch)
+
+    async def _commit_batch(self, batch: List[Tuple[WriteOp, asyncio.Future]]):
+        outcomes = []
+        try:
+            async with self.pool.writer() as db:
+                await db.execute("BEGIN")
+                for op, future in batch:
+                    await db.execute("SAVEPOINT write_op")
+                    try:
+                        result = await op(db)
+                        await db.execute("RELEASE write_op")
+                        outcomes.append((future, result, None))
+                    except Exception as e:
+                        await db.execute("ROLLBACK TO write_op")
+                        await db.execute("RELEASE write_op")
+                        outcomes.append((future, None, e))
+        except Exception as e:
+            logger.error(f"Write batch of {len(batch)} operations failed: {repr(e)}")
+            outcomes = [(future, None, e) for _, future in batch]
+        self.batches += 1
+        self.operations += len(batch)
+        for future, result, error in outcomes:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
@@ -0,0 +1,33 @@
+"""
+FinRiskGPT job worker
+
+Runs queued jobs (risk analyses) outside the API processes. Start with
+JOB_WORKERS_IN_API=false on the API side and run `python worker.py` here.
+"""
+
+import asyncio
+import logging
+import signal
+
+from main import build_job_worker_pool, close_shared_resources, db_manager, job_backend
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def run_worker():
+    await db_manager.connect()
+    pool = build_job_worker_pool()
+    await pool.start()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    logger.info("Shutting down job worker")
+    await pool.stop()
+    await close_shared_resources()
+
+
+if __name__ == "__main__":
+    asyncio.run(run_worker())